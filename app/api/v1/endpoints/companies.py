@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Query, HTTPException, Depends, status
 from datetime import datetime
+from typing import Optional
 
 from app.core.config import settings
+from app.utils.cursor import encode_cursor, decode_cursor
 from app.services.companies import CompanyService, company_service
 from app.schemas.companies import (
     CompanyResponse, 
@@ -28,6 +30,10 @@ async def get_companies(
         le=settings.MAX_PER_PAGE,
         description="Number of items per page",
     ),
+    cursor: Optional[str] = Query(
+        None,
+        description="next_cursor from the previous page; when set, page is ignored",
+    ),
     service: CompanyService = Depends(get_company_service),
     current_user: dict = Depends(get_current_user)
 ):
@@ -36,16 +42,29 @@ async def get_companies(
     Args:
         page (int, optional): Page number. Defaults to Query(1, ge=1, description="Page number").
         per_page (int, optional): Number of items per page. Defaults to Query(settings.DEFAULT_PER_PAGE, ge=1, le=settings.MAX_PER_PAGE, description="Number of items per page").
+        cursor (str, optional): Opaque next_cursor returned by the previous page. Uses keyset pagination instead of page when set.
         service (CompanyService, optional): Company service instance. Defaults to Depends(get_company_service).
     """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
     try:
         skip = (page - 1) * per_page
-        companies, total = await service.get_companies(skip=skip, limit=per_page)
+        companies, total = await service.get_companies(skip=skip, limit=per_page, after=after)
+        next_cursor = (
+            encode_cursor(companies[-1].fecha_creacion, companies[-1].empresa_id)
+            if len(companies) == per_page
+            else None
+        )
 
         company_responses = [CompanyResponse(**c.to_dict()) for c in companies]
 
         return CompanyListResponse(
-            companies=company_responses, total=total, page=page, per_page=per_page
+            companies=company_responses, total=total,
+            page=None if after is not None else page, per_page=per_page,
+            next_cursor=next_cursor,
         )
     except Exception as e:
         raise e
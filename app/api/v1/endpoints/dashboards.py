@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Query, HTTPException, Depends
 from datetime import datetime
+from typing import Optional
 
 from app.core.config import settings
+from app.utils.cursor import encode_cursor, decode_cursor
 from app.middleware.auth import get_current_user
 from app.services.dashboards import DashboardService, dashboard_service
 from app.schemas.dashboards import DashboardResponse, DashboardListResponse, DashboardUpdateRequest, DashboardUpdateResponse, DashboardCreateRequest, DashboardCreateResponse
@@ -21,6 +23,10 @@ async def get_dashboards(
         le=settings.MAX_PER_PAGE,
         description="Number of items per page",
     ),
+    cursor: Optional[str] = Query(
+        None,
+        description="next_cursor from the previous page; when set, page is ignored",
+    ),
     company_id: str = Query(None, description="Company ID"),
     product_id: str = Query(None, description="Product ID"),
     service: DashboardService = Depends(get_dashboard_service),
@@ -33,16 +39,29 @@ async def get_dashboards(
         per_page (int, optional): Number of items per page. Defaults to Query(settings.DEFAULT_PER_PAGE, ge=1, le=settings.MAX_PER_PAGE, description="Number of items per page").
         company_id (str, optional): Company ID to filter dashboards. Defaults to None.
         product_id (str, optional): Product ID to filter dashboards. Defaults to None.
+        cursor (str, optional): Opaque next_cursor returned by the previous page. Uses keyset pagination instead of page when set.
         service (DashboardService, optional): Dashboard service instance. Defaults to Depends(get_dashboard_service).
     """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
     try:
         skip = (page - 1) * per_page
-        dashboards, total = await service.get_dashboards(skip=skip, limit=per_page, company_id=company_id, product_id=product_id)
+        dashboards, total = await service.get_dashboards(skip=skip, limit=per_page, company_id=company_id, product_id=product_id, after=after)
+        next_cursor = (
+            encode_cursor(dashboards[-1].fecha_creacion, dashboards[-1].dashboard_id)
+            if len(dashboards) == per_page
+            else None
+        )
 
         dashboard_responses = [DashboardResponse(**d.to_dict()) for d in dashboards]
 
         return DashboardListResponse(
-            dashboards=dashboard_responses, total=total, page=page, per_page=per_page
+            dashboards=dashboard_responses, total=total,
+            page=None if after is not None else page, per_page=per_page,
+            next_cursor=next_cursor,
         )
     except Exception as e:
         raise e
@@ -4,6 +4,7 @@ from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel, Field
 from typing import Optional
 from app.websocket.connection_manager import manager
+from app.services.chat_context_builder import chat_context_builder
 
 router = APIRouter(
     prefix="/webhook",
@@ -77,6 +78,10 @@ async def batch_completed_webhook(payload: BatchCompletedWebhook):
         dict: Confirmation message with notification count
     """
     try:
+        # Results are already in BigQuery: drop the app's cached chat contexts
+        # so the next chat sees them instead of waiting out CONTEXT_CACHE_TTL
+        chat_context_builder.invalidate(payload.app_id)
+
         # Get subscribers before notifying (for count)
         subscribers_count = 0
         if payload.batch_id in manager.batch_subscriptions:
@@ -132,6 +137,10 @@ async def reviews_batch_completed_webhook(payload: ReviewsBatchCompletedWebhook)
         dict: Confirmation message with notification count
     """
     try:
+        # Results are already in BigQuery: drop the app's cached chat contexts
+        # so the next chat sees them instead of waiting out CONTEXT_CACHE_TTL
+        chat_context_builder.invalidate(payload.app_id)
+
         # Get subscribers before notifying (for count)
         subscribers_count = 0
         if payload.batch_id in manager.batch_subscriptions:
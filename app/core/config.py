@@ -8,6 +8,7 @@ from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
 from app.integrations.openai.review_prompt import SYSTEM_PROMPT
 
 
@@ -57,6 +58,9 @@ class Settings(BaseSettings):
     BQ_MAX_CONNECTIONS: int = Field(default=10)
     BQ_CONNECTION_TIMEOUT: int = Field(default=60)
     BQ_QUERY_TIMEOUT: int = Field(default=300)
+    BQ_THREAD_POOL_SIZE: int = Field(default=32)  # Max concurrent blocking BigQuery calls per process
+    BQ_MAX_CONCURRENT_QUERIES: int = Field(default=50)  # Max in-flight BigQuery queries per service
+    EMERGING_THEMES_MAX_CONCURRENT_SCANS: int = Field(default=5)  # Max in-flight 90-day reviews scans per process
 
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = Field(default=100)
@@ -71,6 +75,8 @@ class Settings(BaseSettings):
     OPENAI_BATCH_SIZE: int = Field(default=1)
     OPENAI_MODEL: str = Field(default="gpt-4o")
     OPENAI_CHAT_MODEL: str = Field(default="gpt-4o-mini")  # Model for chat feature
+    OPENAI_MAX_CONCURRENCY: int = Field(default=16)  # Max in-flight chat completions per process
+    PROMPT_TOKEN_BUDGET: int = Field(default=4000)  # Max estimated tokens for the chat system prompt
 
     # MCP (Model Context Protocol) Configuration
     MCP_ENABLED: bool = Field(default=True, description="Enable MCP for marketing chat (feature flag)")
@@ -98,6 +104,7 @@ class Settings(BaseSettings):
     REDIS_URL: Optional[str] = Field(default=None)
     CACHE_TTL: int = Field(default=300)
     ENABLE_CACHE: bool = Field(default=False)
+    CONTEXT_CACHE_TTL: int = Field(default=86400)  # Chat context cache (seconds); matches daily review ingestion
 
     # Email Configuration
     SMTP_HOST: Optional[str] = Field(default=None)
@@ -274,10 +281,35 @@ class BigQueryConfig:
             os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = self.credentials_path
 
         self.client = bigquery.Client(project=self.project_id)
+        # Pool HTTP compartido por todos los servicios: al menos una conexión por hilo
+        # del executor para que las llamadas concurrentes no descarten conexiones
+        pool_size = max(settings.BQ_MAX_CONNECTIONS, settings.BQ_THREAD_POOL_SIZE)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.client._http.mount("https://", adapter)
+        self._bqstorage_client = None
 
     def get_client(self):
         return self.client
 
+    def get_bqstorage_client(self):
+        """Cliente de la Storage Read API (gRPC/Arrow), creado una sola vez bajo demanda"""
+        if self._bqstorage_client is None:
+            from google.cloud import bigquery_storage
+
+            self._bqstorage_client = bigquery_storage.BigQueryReadClient(
+                credentials=self.client._credentials
+            )
+        return self._bqstorage_client
+
+    def warmup(self):
+        """
+        Ejecutar un SELECT 1 para obtener el token OAuth y abrir la conexión HTTP
+        antes de la primera request real, y crear el cliente de la Storage Read API.
+        Bloqueante: llamar desde un hilo.
+        """
+        next(iter(self.client.query("SELECT 1").result()))
+        self.get_bqstorage_client()
+
     def get_table_id(self, table_name):
         return f"{self.project_id}.{self.dataset_id}.{table_name}"
 
@@ -0,0 +1,45 @@
+-- Desnormalizar los ratings de DIM_REVIEWS_HISTORICO en DIM_MAESTRO_REVIEWS
+-- Ejecutar: bq query --use_legacy_sql=false < 002_add_rating_to_maestro_reviews.sql
+
+ALTER TABLE `marketing-dwh-specs.DWH.DIM_MAESTRO_REVIEWS`
+ADD COLUMN IF NOT EXISTS rating STRUCT<
+  avg_rating FLOAT64 OPTIONS(description="Promedio de score de reviews (histórico completo, score > 0)"),
+  total_ratings INT64 OPTIONS(description="Cantidad de reviews con score (histórico completo, score > 0)"),
+  last_computed TIMESTAMP OPTIONS(description="Fecha y hora del último recálculo")
+> OPTIONS(description="Agregado de ratings mantenido por la scheduled query de abajo");
+
+-- Backfill inicial. Programar esta misma sentencia como scheduled query (cada 1 hora)
+-- para mantener el agregado al día; la API solo lee maestro y nunca toca el histórico.
+-- La scheduled query se configura en BigQuery (no hay scheduler en este repo): sin
+-- ella el agregado queda congelado en el valor del backfill.
+-- MERGE y no UPDATE ... FROM: las apps que ya no tienen reviews con score no
+-- aparecen en el origen y hay que limpiarles el rating (WHEN NOT MATCHED BY SOURCE).
+MERGE `marketing-dwh-specs.DWH.DIM_MAESTRO_REVIEWS` m
+USING (
+  SELECT
+    app_id,
+    ROUND(AVG(CAST(score AS FLOAT64)), 2) AS avg_rating,
+    COUNT(*) AS total_ratings
+  FROM `marketing-dwh-specs.DWH.DIM_REVIEWS_HISTORICO`
+  WHERE score IS NOT NULL
+    AND score > 0
+  GROUP BY app_id
+) r
+ON m.app_id = r.app_id
+WHEN MATCHED THEN
+  UPDATE SET rating = STRUCT(
+    r.avg_rating AS avg_rating,
+    r.total_ratings AS total_ratings,
+    CURRENT_TIMESTAMP() AS last_computed
+  )
+WHEN NOT MATCHED BY SOURCE AND m.rating IS NOT NULL THEN
+  UPDATE SET rating = NULL;
+
+-- Comentarios sobre el uso:
+-- 1. Ejecutar ANTES de desplegar el código que lee m.rating.total_ratings (apps.py):
+--    sin la columna las consultas de apps fallan
+-- 2. Sin ventana de fechas: total_ratings es el total histórico, como lo calculaba la API
+--    leyendo DIM_REVIEWS_HISTORICO. Apps sin reviews con score quedan con rating NULL;
+--    la API lo trata como 0 ratings
+-- 3. El promedio mostrado al usuario sigue siendo app_rating (el rating de la tienda)
+-- 4. Si cambia el filtro de score, re-ejecutar el MERGE para recalcular todo
@@ -0,0 +1,25 @@
+-- Particionar AIOutput.Reviews_Analysis por review_date y clusterizar por app_id
+-- Ejecutar: bq query --use_legacy_sql=false < 003_partition_reviews_analysis.sql
+
+-- BigQuery no permite cambiar el particionado de una tabla existente:
+-- se crea una copia particionada y luego se intercambian los nombres.
+CREATE TABLE IF NOT EXISTS `marketing-dwh-specs.AIOutput.Reviews_Analysis_partitioned`
+PARTITION BY review_date
+CLUSTER BY app_id
+OPTIONS(
+  description="Análisis de reviews generado por IA, particionado por review_date y clusterizado por app_id"
+)
+AS
+SELECT * FROM `marketing-dwh-specs.AIOutput.Reviews_Analysis`;
+
+ALTER TABLE `marketing-dwh-specs.AIOutput.Reviews_Analysis`
+RENAME TO Reviews_Analysis_legacy;
+
+ALTER TABLE `marketing-dwh-specs.AIOutput.Reviews_Analysis_partitioned`
+RENAME TO Reviews_Analysis;
+
+-- Comentarios sobre el uso:
+-- 1. Ejecutar con los jobs de análisis detenidos para no perder filas entre la copia y el rename
+-- 2. El contexto del chat filtra por app_id y review_date y toma el último analyzed_at
+--    (ORDER BY analyzed_at DESC LIMIT 1): con esta estructura solo lee las particiones y bloques del app
+-- 3. Borrar Reviews_Analysis_legacy una vez verificado el conteo de filas
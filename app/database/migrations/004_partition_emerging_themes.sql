@@ -0,0 +1,26 @@
+-- Particionar AIOutput.EMERGING_THEMES por DATE(created_at) y clusterizar por app_id, cache_key
+-- Ejecutar: bq query --use_legacy_sql=false < 004_partition_emerging_themes.sql
+
+-- BigQuery no permite cambiar el particionado de una tabla existente:
+-- se crea una copia particionada y luego se intercambian los nombres.
+CREATE TABLE IF NOT EXISTS `marketing-dwh-specs.AIOutput.EMERGING_THEMES_partitioned`
+PARTITION BY DATE(created_at)
+CLUSTER BY app_id, cache_key
+OPTIONS(
+  description="Análisis de temas emergentes por app, particionado por created_at y clusterizado por app_id y cache_key"
+)
+AS
+SELECT * FROM `marketing-dwh-specs.AIOutput.EMERGING_THEMES`;
+
+ALTER TABLE `marketing-dwh-specs.AIOutput.EMERGING_THEMES`
+RENAME TO EMERGING_THEMES_legacy;
+
+ALTER TABLE `marketing-dwh-specs.AIOutput.EMERGING_THEMES_partitioned`
+RENAME TO EMERGING_THEMES;
+
+-- Comentarios sobre el uso:
+-- 1. Ejecutar con los análisis detenidos para no perder filas entre la copia y el rename
+-- 2. La búsqueda en cache filtra por cache_key y created_at (ventana de 24h): lee solo
+--    las particiones recientes. La del último análisis filtra solo por app_id (sin límite
+--    de antigüedad) y se apoya en el clustering para leer los bloques de la app
+-- 3. Borrar EMERGING_THEMES_legacy una vez verificado el conteo de filas
@@ -1,7 +1,8 @@
 import io
-import json
-from datetime import datetime
-from typing import List, Tuple
+import orjson
+from datetime import datetime, timezone
+from typing import Tuple
+import pyarrow as pa
 from openai import OpenAI
 
 from app.core.config import OpenAIConfig
@@ -26,9 +27,10 @@ class OpenAIEmergingThemesBatchIntegration:
         app_id: str,
         app_name: str,
         app_category: str,
-        reviews: List[Tuple[str, int, datetime]],  # (content, score, date)
+        reviews: pa.Table,  # columns: content, score, fecha
         start_date: datetime,
         end_date: datetime,
+        cache_key: str,
     ) -> Tuple[any, any]:
         """
         Analyze reviews to identify emerging themes.
@@ -37,9 +39,11 @@ class OpenAIEmergingThemesBatchIntegration:
             app_id: Application ID
             app_name: Application name
             app_category: Application category
-            reviews: List of tuples containing (content, score, date)
+            reviews: Arrow table with columns content, score and fecha
             start_date: Start date of the analysis period
             end_date: End date of the analysis period
+            cache_key: EmergingThemesService cache key for this analysis; sent in the
+                batch metadata so the result writer stores it verbatim in EMERGING_THEMES
 
         Returns:
             Tuple of (uploaded_file, batch) from OpenAI API
@@ -52,6 +56,7 @@ class OpenAIEmergingThemesBatchIntegration:
             reviews=reviews,
             start_date=start_date,
             end_date=end_date,
+            cache_key=cache_key,
         )
 
         # Upload and create batch
@@ -62,7 +67,8 @@ class OpenAIEmergingThemesBatchIntegration:
             app_category,
             start_date,
             end_date,
-            len(reviews)
+            reviews.num_rows,
+            cache_key,
         )
 
     def _create_emerging_themes_jsonl(
@@ -70,17 +76,18 @@ class OpenAIEmergingThemesBatchIntegration:
         app_id: str,
         app_name: str,
         app_category: str,
-        reviews: List[Tuple[str, int, datetime]],
+        reviews: pa.Table,
         start_date: datetime,
         end_date: datetime,
-    ) -> str:
+        cache_key: str,
+    ) -> bytes:
         """
         Create a JSONL file with a SINGLE request containing ALL reviews.
 
         The prompt is constructed by replacing placeholders and including all reviews
         as context for the analysis.
         """
-        total_reviews = len(reviews)
+        total_reviews = reviews.num_rows
 
         # Build the system prompt with replaced placeholders
         system_prompt = self._build_system_prompt(
@@ -113,11 +120,12 @@ class OpenAIEmergingThemesBatchIntegration:
                 "app_id": app_id,
                 "app_name": app_name,
                 "app_category": app_category,
+                "cache_key": cache_key,
             },
         }
 
         # Create the batch request line with a unique custom_id
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
         request_line = {
             "custom_id": f"emerging-themes-{app_id}-{timestamp}",
             "method": "POST",
@@ -125,8 +133,8 @@ class OpenAIEmergingThemesBatchIntegration:
             "body": body,
         }
 
-        # Return as JSONL (single line)
-        return json.dumps(request_line)
+        # Return as JSONL (single line), already UTF-8 encoded for the upload
+        return orjson.dumps(request_line)
 
     def _build_system_prompt(
         self,
@@ -149,23 +157,27 @@ class OpenAIEmergingThemesBatchIntegration:
             end_date=end_date.strftime("%Y-%m-%d"),
         )
 
-    def _build_user_content(self, reviews: List[Tuple[str, int, datetime]]) -> str:
+    def _build_user_content(self, reviews: pa.Table) -> str:
         """
         Build user content with all reviews formatted.
 
         Format: Each review as "Date | Score: X/5 | Content"
         """
-        formatted_reviews = []
-
-        for idx, (content, score, review_date) in enumerate(reviews, 1):
-            date_str = review_date.strftime("%Y-%m-%d")
-            formatted_review = f"Review {idx} | {date_str} | Score: {score}/5\n{content}\n"
-            formatted_reviews.append(formatted_review)
+        # Materialize each Arrow column once (fecha is a DATE, so casting it to
+        # string yields YYYY-MM-DD for the whole column in one pass)
+        rows = zip(
+            reviews.column("content").to_pylist(),
+            reviews.column("score").to_pylist(),
+            reviews.column("fecha").cast(pa.string()).to_pylist(),
+        )
 
         # Join all reviews with separator
-        all_reviews = "\n" + "="*80 + "\n\n".join(formatted_reviews)
+        all_reviews = "\n" + "="*80 + "\n\n".join(
+            f"Review {idx} | {date_str} | Score: {score}/5\n{content}\n"
+            for idx, (content, score, date_str) in enumerate(rows, 1)
+        )
 
-        return f"""A continuación se presentan {len(reviews)} reviews de usuarios para analizar: 
+        return f"""A continuación se presentan {reviews.num_rows} reviews de usuarios para analizar: 
         
         {all_reviews}
         
@@ -173,32 +185,34 @@ class OpenAIEmergingThemesBatchIntegration:
 
     def _upload_and_create_batch(
         self, 
-        jsonl_content: str, 
+        jsonl_content: bytes, 
         app_id: str,
         app_name: str,
         app_category: str,
         start_date: datetime,
         end_date: datetime,
-        total_reviews: int
+        total_reviews: int,
+        cache_key: str,
     ):
         """
         Upload the JSONL file and create a batch job.
 
         Args:
-            jsonl_content: JSONL formatted string
+            jsonl_content: JSONL formatted bytes
             app_id: Application ID for metadata
             app_name: Application name
             app_category: Application category
             start_date: Start date of analysis
             end_date: End date of analysis
             total_reviews: Total number of reviews analyzed
+            cache_key: Cache key the result row must be stored under
 
         Returns:
             Tuple of (uploaded_file, batch)
         """
         # Upload file
         uploaded_file = self.client.files.create(
-            file=io.BytesIO(jsonl_content.encode("utf-8")),
+            file=io.BytesIO(jsonl_content),
             purpose="batch",
         )
 
@@ -216,6 +230,7 @@ class OpenAIEmergingThemesBatchIntegration:
                 "analysis_period_end": end_date.strftime("%Y-%m-%d"),
                 "total_reviews_analyzed": str(total_reviews),
                 "analysis_type": "reviews_pattern_detection",
+                "cache_key": cache_key,
             },
         )
 
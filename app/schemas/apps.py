@@ -21,7 +21,7 @@ class AppDetailsResponse(BaseModel):
         None,
         alias="totalRatings",
         ge=0,
-        description="Total number of ratings from reviews"
+        description="Total number of reviews with a score, all time (hourly aggregate, see migration 002)"
     )
     downloads: int = Field(0, ge=0, description="Number of downloads")
     last_update: date = Field(..., alias="lastUpdate", description="Last update date")
@@ -51,7 +51,7 @@ class CompanyResponse(BaseModel):
     fecha_fin_relacion: Optional[datetime] = Field(None, description="Fecha de fin de la relación con la empresa")
     estado_empresa: str = Field(..., description="Estado actual de la empresa")
     motivo_cierre: Optional[str] = Field(None, description="Motivo del cierre de la empresa, si aplica")
-    fecha_creacion: datetime = Field(..., description="Fecha de creación del registro de la empresa")
+    fecha_creacion: Optional[datetime] = Field(None, description="Fecha de creación del registro de la empresa")
     fecha_actualizacion: Optional[datetime] = Field(None, description="Fecha de la última actualización del registro de la empresa")
     
     class Config:
@@ -75,8 +75,9 @@ class CompanyResponse(BaseModel):
 class CompanyListResponse(BaseModel):
     companies: list[CompanyResponse]
     total: int
-    page: int
+    page: Optional[int] = None  # None en respuestas paginadas por cursor
     per_page: int
+    next_cursor: Optional[str] = None
     
 class CompanyInternal(BaseModel):
     empresa_id: str
@@ -87,7 +88,7 @@ class CompanyInternal(BaseModel):
     fecha_fin_relacion: Optional[datetime]
     estado_empresa: str
     motivo_cierre: Optional[str]
-    fecha_creacion: datetime
+    fecha_creacion: Optional[datetime]
     fecha_actualizacion: Optional[datetime]
     
     def to_dict(self):
@@ -11,7 +11,7 @@ class DashboardResponse(BaseModel):
     url: str = Field(..., description="URL del dashboard")
     embed_url: str = Field(..., description="URL embebida del dashboard")
     estado: str = Field(..., description="Estado actual del dashboard")
-    fecha_creacion: datetime = Field(..., description="Fecha de creación del registro del dashboard")
+    fecha_creacion: Optional[datetime] = Field(None, description="Fecha de creación del registro del dashboard")
     fecha_actualizacion: Optional[datetime] = Field(None, description="Fecha de la última actualización del registro del dashboard")
     
     class Config:
@@ -34,8 +34,9 @@ class DashboardResponse(BaseModel):
 class DashboardListResponse(BaseModel):
     dashboards: list[DashboardResponse]
     total: int
-    page: int
+    page: Optional[int] = None  # None en respuestas paginadas por cursor
     per_page: int
+    next_cursor: Optional[str] = None
 
 class DashboardCreateRequest(BaseModel):
     dash_id: str = Field(..., description="Identificador único del dashboard")
@@ -88,7 +89,7 @@ class DashboardInternal(BaseModel):
     url: str
     embed_url: str
     estado: str
-    fecha_creacion: datetime
+    fecha_creacion: Optional[datetime]
     fecha_actualizacion: Optional[datetime]
     
     def to_dict(self):
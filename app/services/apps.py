@@ -1,39 +1,160 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, ClassVar
 from google.cloud import bigquery
 from app.core.exceptions import DatabaseConnectionError
 from app.schemas.apps import AppDetailsResponse
 from app.core.config import bigquery_config
 from datetime import datetime, date, timedelta
+import asyncio
 import logging
 import httpx
 import os
+from urllib.parse import urlparse
 from google.auth.transport.requests import Request
 from google.oauth2 import id_token
 
 logger = logging.getLogger(__name__)
 
 
+def _scraper_url_from_env(name: str) -> str:
+    """Read a scraper base URL from the environment, validated once at import.
+
+    The trailing slash is stripped so f"{url}/scrape" never double-slashes.
+    """
+    url = os.environ[name].strip().rstrip("/")
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise RuntimeError(f"{name} must be an absolute http(s) URL, got: {url!r}")
+    return url
+
+
 class AppService:
     # Class constants for default values
     DEFAULT_DEVELOPER = 'Unknown Developer'
     DEFAULT_CATEGORY = 'Unknown Category'
     DEFAULT_ICON_URL = ''
     DEFAULT_DOWNLOADS = 0
+
+    # Paginación de search_apps: tamaño de página por defecto y tope server-side
+    SEARCH_DEFAULT_LIMIT = 50
+    SEARCH_MAX_LIMIT = 200
+
     
     # Cloud Run scraper endpoints - Required environment variables (fail-fast if not set)
-    ANDROID_SCRAPER_URL = os.environ["ANDROID_SCRAPER_URL"]
-    IOS_SCRAPER_URL = os.environ["IOS_SCRAPER_URL"]
+    ANDROID_SCRAPER_URL: ClassVar[str] = _scraper_url_from_env("ANDROID_SCRAPER_URL")
+    IOS_SCRAPER_URL: ClassVar[str] = _scraper_url_from_env("IOS_SCRAPER_URL")
     
     def __init__(self) -> None:
         self.client = bigquery_config.get_client()
         self.maestro_table = bigquery_config.get_table_id("DIM_MAESTRO_REVIEWS")
-        self.historico_table = bigquery_config.get_table_id("DIM_REVIEWS_HISTORICO")
+
+        # SQL precompilado una sola vez: el texto queda idéntico entre requests
+        # (solo cambian los parámetros), lo que maximiza hits en la cache de BigQuery
+        app_columns = f"""
+            app_id,
+            app_name,
+            LOWER(SO) as store,
+            COALESCE(app_desarrollador, '{self.DEFAULT_DEVELOPER}') as developer,
+            COALESCE(app_descargas, {self.DEFAULT_DOWNLOADS}) as downloads,
+            COALESCE(app_icon_url, '{self.DEFAULT_ICON_URL}') as icon_url,
+            COALESCE(app_categoria, '{self.DEFAULT_CATEGORY}') as category,
+            COALESCE(fecha_actualizacion, CURRENT_DATE()) as last_update,
+            app_rating as rating,
+            COALESCE(m.rating.total_ratings, 0) as total_ratings"""
+
+        # Texto constante: filtros opcionales y defaults viajan como parámetros.
+        # Se filtra primero en un CTE y recién después se aplican los COALESCE/TRIM
+        self._search_apps_sql = f"""
+        WITH filtered AS (
+            SELECT
+                app_id,
+                app_name,
+                SO,
+                app_desarrollador,
+                app_descargas,
+                app_icon_url,
+                app_categoria,
+                fecha_actualizacion,
+                app_rating,
+                rating.total_ratings AS total_ratings
+            FROM `{self.maestro_table}`
+            WHERE LOWER(app_name) LIKE @app_name
+            AND (@store IS NULL OR LOWER(SO) = @store)
+            AND (@country IS NULL OR LOWER(country_code) = @country)
+            -- Una fila por app/store: ventana particionada en lugar de un DISTINCT global
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY app_id, SO ORDER BY fecha_actualizacion DESC) = 1
+        )
+        SELECT
+            app_id,
+            TRIM(app_name) as app_name,
+            LOWER(SO) as store,
+            TRIM(COALESCE(app_desarrollador, @default_developer)) as developer,
+            COALESCE(app_descargas, @default_downloads) as downloads,
+            COALESCE(app_icon_url, @default_icon_url) as icon_url,
+            TRIM(COALESCE(app_categoria, @default_category)) as category,
+            COALESCE(fecha_actualizacion, CURRENT_DATE()) as last_update,
+            app_rating as rating,
+            COALESCE(total_ratings, 0) as total_ratings
+        FROM filtered
+        ORDER BY downloads DESC, app_name ASC
+        LIMIT @limit
+        OFFSET @offset
+        """
+
+        self._app_details_sql = f"""
+        SELECT {app_columns}
+        FROM `{self.maestro_table}` m
+        WHERE LOWER(m.app_id) = LOWER(@app_id)
+        LIMIT 1
+        """
+
+        self._app_by_review_id_sql = f"""
+        SELECT {app_columns}
+        FROM `{self.maestro_table}` m
+        WHERE review_id = @review_id
+        LIMIT 1
+        """
+
+        # Cliente HTTP compartido para los scrapers: reutiliza conexiones TLS entre llamadas
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+            http2=True,
+        )
+
+    async def aclose(self) -> None:
+        """Close the shared scraper HTTP client (called on app shutdown)."""
+        await self._http.aclose()
+
+    async def _run_query(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> list:
+        """Run a BigQuery query off the event loop and return all rows."""
+        return await asyncio.to_thread(
+            lambda: list(self.client.query(sql, job_config=job_config).result())
+        )
+
+    async def _run_query_arrow(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> List[Dict[str, Any]]:
+        """Run a query and download results through the Storage Read API (Arrow).
+
+        Used for multi-row results, where paging the REST API row by row dominates latency.
+        """
+        bqstorage_client = bigquery_config.get_bqstorage_client()
+        table = await asyncio.to_thread(
+            lambda: self.client.query(sql, job_config=job_config)
+            .result()
+            .to_arrow(bqstorage_client=bqstorage_client)
+        )
+        return table.to_pylist()
 
     async def search_apps(
         self,
         app_name: str,
         store: Optional[str] = None,
-        country: Optional[str] = None
+        country: Optional[str] = None,
+        limit: int = SEARCH_DEFAULT_LIMIT,
+        offset: int = 0
     ) -> List[AppDetailsResponse]:
         """Search for apps by name with optional filters.
 
@@ -41,6 +162,8 @@ class AppService:
             app_name: Name to search for (partial matching)
             store: Optional store filter (android/ios)
             country: Optional country filter
+            limit: Page size, clamped to SEARCH_MAX_LIMIT
+            offset: Number of results to skip
 
         Returns:
             List of AppDetailsResponse objects
@@ -49,43 +172,21 @@ class AppService:
             DatabaseConnectionError: If query fails
         """
         
-        # Construir condiciones WHERE dinámicamente
-        where_conditions = ["LOWER(app_name) LIKE @app_name"]
+        # Siempre los mismos parámetros en el mismo orden; los filtros omitidos van como NULL
         query_params = [
-            bigquery.ScalarQueryParameter("app_name", "STRING", f"%{app_name.lower()}%")
+            bigquery.ScalarQueryParameter("app_name", "STRING", f"%{app_name.lower()}%"),
+            bigquery.ScalarQueryParameter("store", "STRING", store.lower() if store else None),
+            bigquery.ScalarQueryParameter("country", "STRING", country.lower() if country else None),
+            bigquery.ScalarQueryParameter("default_developer", "STRING", self.DEFAULT_DEVELOPER),
+            bigquery.ScalarQueryParameter("default_downloads", "INT64", self.DEFAULT_DOWNLOADS),
+            bigquery.ScalarQueryParameter("default_icon_url", "STRING", self.DEFAULT_ICON_URL),
+            bigquery.ScalarQueryParameter("default_category", "STRING", self.DEFAULT_CATEGORY),
+            bigquery.ScalarQueryParameter("limit", "INT64", max(1, min(int(limit), self.SEARCH_MAX_LIMIT))),
+            bigquery.ScalarQueryParameter("offset", "INT64", max(0, int(offset))),
         ]
 
-        if store:
-            where_conditions.append("LOWER(SO) = @store")
-            query_params.append(
-                bigquery.ScalarQueryParameter("store", "STRING", store.lower())
-            )
-
-        if country:
-            where_conditions.append("LOWER(country_code) = @country")
-            query_params.append(
-                bigquery.ScalarQueryParameter("country", "STRING", country.lower())
-            )
-
-        where_clause = "WHERE " + " AND ".join(where_conditions)
-
         # Query principal para obtener datos de las apps
-        main_query = f"""
-        SELECT DISTINCT
-            m.app_id,
-            m.app_name,
-            LOWER(m.SO) as store,
-            COALESCE(m.app_desarrollador, '{self.DEFAULT_DEVELOPER}') as developer,
-            COALESCE(m.app_descargas, {self.DEFAULT_DOWNLOADS}) as downloads,
-            COALESCE(m.app_icon_url, '{self.DEFAULT_ICON_URL}') as icon_url,
-            COALESCE(m.app_categoria, '{self.DEFAULT_CATEGORY}') as category,
-            COALESCE(m.fecha_actualizacion, CURRENT_DATE()) as last_update,
-            m.app_rating as rating,
-            (SELECT COUNT(*) FROM `{self.historico_table}` h WHERE h.app_id = m.app_id) as total_ratings
-        FROM `{self.maestro_table}` m
-        {where_clause}
-        ORDER BY downloads DESC, app_name ASC
-        """
+        main_query = self._search_apps_sql
 
         job_config = bigquery.QueryJobConfig(query_parameters=query_params)
 
@@ -93,8 +194,7 @@ class AppService:
             logger.info(f"Searching apps with name: '{app_name}', store: {store}, country: {country}")
 
             # Ejecutar query principal
-            main_job = self.client.query(main_query, job_config=job_config)
-            main_results = list(main_job.result())
+            main_results = await self._run_query_arrow(main_query, job_config)
 
             if not main_results:
                 logger.info(f"No apps found for search: '{app_name}'")
@@ -104,28 +204,29 @@ class AppService:
             apps = []
             for row in main_results:
                 # Use rating from scraper (stored in DIM_MAESTRO_REVIEWS)
-                rating = row.rating if hasattr(row, 'rating') and row.rating is not None else None
-                total_ratings = row.total_ratings if hasattr(row, 'total_ratings') and row.total_ratings is not None else 0
+                rating = row.get('rating')
+                total_ratings = row.get('total_ratings') or 0
                 
                 # Procesar fecha de actualización
-                last_update = row.last_update
+                last_update = row['last_update']
                 if isinstance(last_update, datetime):
                     last_update = last_update.date()
                 elif last_update is None:
                     last_update = date.today()
 
-                # Crear objeto AppDetailsResponse
-                app = AppDetailsResponse(
-                    app_id=row.app_id,
-                    app_name=row.app_name,
-                    store=row.store,
-                    developer=row.developer,
+                # BigQuery ya tipa las columnas y la query normaliza store (LOWER) y
+                # los strings (TRIM), así que se omite la validación de pydantic
+                app = AppDetailsResponse.model_construct(
+                    app_id=row['app_id'],
+                    app_name=row['app_name'],
+                    store=row['store'],
+                    developer=row['developer'],
                     rating_average=rating,
                     total_ratings=total_ratings,
-                    downloads=row.downloads,
+                    downloads=row['downloads'],
                     last_update=last_update,
-                    icon_url=row.icon_url,
-                    category=row.category
+                    icon_url=row['icon_url'],
+                    category=row['category']
                 )
                 apps.append(app)
 
@@ -136,141 +237,13 @@ class AppService:
             logger.error(f"Error searching apps for '{app_name}': {e}")
             raise DatabaseConnectionError(f"Error querying the database: {e}")
 
-    async def _get_app_ratings(self, app_id: str) -> dict:
-        """Get rating information for a specific app.
-
-        Args:
-            app_id: App ID to get ratings for
-
-        Returns:
-            Dictionary with 'average_rating' and 'total_ratings'
-        """
-        ratings_query = f"""
-        SELECT
-            AVG(score) as average_rating,
-            COUNT(*) as total_ratings
-        FROM `{self.historico_table}`
-        WHERE app_id = @app_id
-        """
-
-        query_params = [
-            bigquery.ScalarQueryParameter("app_id", "STRING", app_id)
-        ]
-
-        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-
-        try:
-            ratings_job = self.client.query(ratings_query, job_config=job_config)
-            ratings_results = list(ratings_job.result())
-
-            if ratings_results and ratings_results[0].total_ratings > 0:
-                rating_data = ratings_results[0]
-                return {
-                    'average_rating': round(rating_data.average_rating, 2) if rating_data.average_rating else None,
-                    'total_ratings': rating_data.total_ratings
-                }
-            else:
-                return {
-                    'average_rating': None,
-                    'total_ratings': None
-                }
-
-        except Exception as e:
-            logger.warning(f"Error getting ratings for app {app_id}: {e}")
-            return {
-                'average_rating': None,
-                'total_ratings': None
-            }
-
-    async def _get_batch_app_ratings(self, app_ids: List[str]) -> dict:
-        """Get rating information for multiple apps in a single query.
-        
-        Args:
-            app_ids: List of app IDs to get ratings for
-            
-        Returns:
-            Dictionary mapping app_id to rating data: {app_id: {'average_rating': float, 'total_ratings': int}}
-        """
-        if not app_ids:
-            return {}
-            
-        try:
-            logger.debug(f"Getting ratings for {len(app_ids)} apps in batch")
-            
-            # Create batch ratings query
-            ratings_query = f"""
-            SELECT
-                app_id,
-                AVG(CAST(score AS FLOAT64)) as average_rating,
-                COUNT(*) as total_ratings
-            FROM `{self.historico_table}`
-            WHERE app_id IN UNNEST(@app_ids)
-            AND score IS NOT NULL 
-            AND score > 0
-            GROUP BY app_id
-            """
-            
-            job_config = bigquery.QueryJobConfig(
-                query_parameters=[
-                    bigquery.ArrayQueryParameter("app_ids", "STRING", app_ids)
-                ]
-            )
-            
-            ratings_job = self.client.query(ratings_query, job_config=job_config)
-            ratings_results = list(ratings_job.result())
-            
-            # Process results into dictionary
-            ratings_dict = {}
-            for row in ratings_results:
-                if row.total_ratings and row.total_ratings > 0 and row.average_rating is not None:
-                    ratings_dict[row.app_id] = {
-                        'average_rating': round(float(row.average_rating), 2),
-                        'total_ratings': int(row.total_ratings)
-                    }
-                else:
-                    ratings_dict[row.app_id] = {
-                        'average_rating': None,
-                        'total_ratings': 0
-                    }
-            
-            # Ensure all requested app_ids have entries (even if no ratings found)
-            for app_id in app_ids:
-                if app_id not in ratings_dict:
-                    ratings_dict[app_id] = {
-                        'average_rating': None,
-                        'total_ratings': 0
-                    }
-            
-            logger.debug(f"Successfully retrieved ratings for {len(ratings_dict)} apps")
-            return ratings_dict
-            
-        except Exception as e:
-            logger.warning(f"Error getting batch ratings for apps: {e}")
-            # Return empty dict for all apps if batch query fails
-            return {app_id: {'average_rating': None, 'total_ratings': 0} for app_id in app_ids}
-
     async def get_app_details(self, app_id: str) -> Optional[AppDetailsResponse]:
         """Get details for a specific app by ID"""
         try:
             logger.info(f"Getting details for app: {app_id}")
             
             # Query to get app details from maestro table
-            query = f"""
-                SELECT 
-                    app_id,
-                    app_name,
-                    LOWER(SO) as store,
-                    COALESCE(app_desarrollador, '{self.DEFAULT_DEVELOPER}') as developer,
-                    COALESCE(app_descargas, {self.DEFAULT_DOWNLOADS}) as downloads,
-                    COALESCE(app_icon_url, '{self.DEFAULT_ICON_URL}') as icon_url,
-                    COALESCE(app_categoria, '{self.DEFAULT_CATEGORY}') as category,
-                    COALESCE(fecha_actualizacion, CURRENT_DATE()) as last_update,
-                    app_rating as rating,
-                    (SELECT COUNT(*) FROM `{self.historico_table}` h WHERE h.app_id = m.app_id) as total_ratings
-                FROM `{self.maestro_table}` m
-                WHERE LOWER(m.app_id) = LOWER(@app_id)
-                LIMIT 1
-            """
+            query = self._app_details_sql
             
             job_config = bigquery.QueryJobConfig(
                 query_parameters=[
@@ -278,8 +251,7 @@ class AppService:
                 ]
             )
             
-            result = self.client.query(query, job_config=job_config)
-            rows = list(result)
+            rows = await self._run_query(query, job_config)
             
             if not rows:
                 logger.warning(f"App not found: {app_id}")
@@ -289,7 +261,7 @@ class AppService:
             
             # Use rating from scraper (stored in DIM_MAESTRO_REVIEWS)
             rating = row.rating if hasattr(row, 'rating') and row.rating is not None else None
-            total_ratings = row.total_ratings if hasattr(row, 'total_ratings') and row.total_ratings is not None else 0
+            total_ratings = row.total_ratings
             
             # Process last_update to ensure it's a date object
             last_update = row.last_update
@@ -388,22 +360,7 @@ class AppService:
         # Construct review_id to search by primary key
         review_id = f"{normalized_app_id}_{store.lower()}_{country.lower()}"
         
-        query = f"""
-        SELECT 
-            app_id,
-            app_name,
-            LOWER(SO) as store,
-            COALESCE(app_desarrollador, '{self.DEFAULT_DEVELOPER}') as developer,
-            COALESCE(app_descargas, {self.DEFAULT_DOWNLOADS}) as downloads,
-            COALESCE(app_icon_url, '{self.DEFAULT_ICON_URL}') as icon_url,
-            COALESCE(app_categoria, '{self.DEFAULT_CATEGORY}') as category,
-            COALESCE(fecha_actualizacion, CURRENT_DATE()) as last_update,
-            app_rating as rating,
-            (SELECT COUNT(*) FROM `{self.historico_table}` h WHERE h.app_id = m.app_id) as total_ratings
-        FROM `{self.maestro_table}` m
-        WHERE review_id = @review_id
-        LIMIT 1
-        """
+        query = self._app_by_review_id_sql
         
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
@@ -412,8 +369,7 @@ class AppService:
         )
         
         try:
-            result = self.client.query(query, job_config=job_config)
-            rows = list(result)
+            rows = await self._run_query(query, job_config)
             
             if not rows:
                 return None
@@ -422,7 +378,7 @@ class AppService:
             
             # Use rating from scraper (stored in DIM_MAESTRO_REVIEWS)
             rating = row.rating if hasattr(row, 'rating') and row.rating is not None else None
-            total_ratings = row.total_ratings if hasattr(row, 'total_ratings') and row.total_ratings is not None else 0
+            total_ratings = row.total_ratings
             
             # Process last_update
             last_update = row.last_update
@@ -448,6 +404,47 @@ class AppService:
             logger.error(f"Error querying app {app_id}: {e}")
             raise DatabaseConnectionError(f"Error querying database: {e}")
     
+    def _app_from_scraper_row(
+        self,
+        row: Optional[Dict[str, Any]],
+        store: str
+    ) -> Optional[AppDetailsResponse]:
+        """
+        Build an AppDetailsResponse from the DIM_MAESTRO_REVIEWS row echoed by the scraper.
+        
+        Args:
+            row: The "app" object from the scraper response, if any
+            store: Store type ('android' or 'ios')
+            
+        Returns:
+            AppDetailsResponse, or None if the row is missing or malformed
+        """
+        if not row:
+            return None
+        
+        try:
+            last_update = row.get('fecha_actualizacion')
+            if isinstance(last_update, str):
+                last_update = date.fromisoformat(last_update[:10])
+            elif last_update is None:
+                last_update = date.today()
+            
+            return AppDetailsResponse(
+                app_id=row['app_id'],
+                app_name=row['app_name'],
+                store=row.get('SO') or store,
+                developer=row.get('app_desarrollador') or self.DEFAULT_DEVELOPER,
+                downloads=row.get('app_descargas') or self.DEFAULT_DOWNLOADS,
+                icon_url=row.get('app_icon_url') or self.DEFAULT_ICON_URL,
+                category=row.get('app_categoria') or self.DEFAULT_CATEGORY,
+                last_update=last_update,
+                rating_average=row.get('app_rating'),
+                total_ratings=(row.get('rating') or {}).get('total_ratings') or 0
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Unusable app row in scraper response, falling back to database: {e}")
+            return None
+    
     async def _scrape_and_insert_app(
         self,
         app_id: str,
@@ -493,24 +490,28 @@ class AppService:
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                response = await client.post(
-                    scraper_url,
-                    json={"app_id": app_id, "country": country},
-                    headers=headers
-                )
-                
-                if response.status_code == 404:
-                    raise ValueError(f"App '{app_id}' not found in {store} store")
-                
-                if response.status_code != 200:
-                    error_msg = response.json().get('error', 'Unknown error')
-                    raise ValueError(f"Scraper error: {error_msg}")
-                
-                result = response.json()
-                logger.info(f"Scraper response: {result}")
+            response = await self._http.post(
+                scraper_url,
+                json={"app_id": app_id, "country": country},
+                headers=headers
+            )
+            
+            if response.status_code == 404:
+                raise ValueError(f"App '{app_id}' not found in {store} store")
+            
+            if response.status_code != 200:
+                error_msg = response.json().get('error', 'Unknown error')
+                raise ValueError(f"Scraper error: {error_msg}")
+            
+            result = response.json()
+            logger.info(f"Scraper response: {result}")
+            
+            # Newer scraper versions return the inserted row: skip the BigQuery re-read
+            app = self._app_from_scraper_row(result.get("app"), store_lower)
+            if app:
+                return app
             
-            # Now fetch the app from database (scraper already inserted it)
+            # Fallback: fetch the app from database (scraper already inserted it)
             app = await self._get_app_by_id(app_id, store_lower, country)
             
             if not app:
@@ -1,26 +1,37 @@
 from typing import List, Optional
+import asyncio
 from google.cloud import bigquery
 from app.core.exceptions import DatabaseConnectionError
 from app.schemas.campaigns import CampaignResponse, CampaignInternal
 from datetime import datetime
 from app.core.config import bigquery_config
+from app.utils.cache import TTLCache
 
 
 class CampaignService:
+    """
+    Lectura de campañas desde DIM_CAMPANA.
+
+    La API no escribe en DIM_CAMPANA: las campañas las cargan procesos externos. Las
+    primeras PAGE_CACHE_ROWS filas y el total por estado se cachean 60 segundos en
+    memoria, así que una escritura externa tarda hasta un minuto en verse y no hay
+    forma de invalidar la cache antes.
+    """
+    # Filas iniciales por estado que se cachean para paginar en memoria
+    PAGE_CACHE_ROWS = 1000
+
     def __init__(self):
         self.client = bigquery_config.get_client()
         self.table_id = bigquery_config.get_table_id("DIM_CAMPANA")
+        # Totales por filtro de estado; cambian poco entre páginas
+        self._count_cache = TTLCache(maxsize=8, ttl=60)
+        # Primeras PAGE_CACHE_ROWS campañas por filtro de estado: (campañas, total)
+        self._page_cache = TTLCache(maxsize=8, ttl=60)
 
-    async def get_campaigns(
-        self, skip: int = 0, limit: int = 10, state: str = "all"
-    ) -> tuple[List[CampaignInternal], int]:
-        """Obtener todas las campañas con paginación"""
-        state_mapping = {
-            "active": "ACTIVA",
-            "paused": "INACTIVA",
-        }
-        base_query = f"""
-        SELECT 
+        # SQL precompilado y constante: el filtro de estado va como array
+        # (vacío = todos) y solo varían los parámetros
+        self._campaigns_sql_template = f"""
+        SELECT
             campana_id,
             network_id,
             empresa_id,
@@ -33,55 +44,113 @@ class CampaignService:
             fecha_ultimo_apagado,
             estado_campana,
             fecha_creacion,
-            fecha_actualizacion
+            fecha_actualizacion{{total_column}}
         FROM `{self.table_id}`
-        """
-
-        where_clause = ""
-        query_params = []
-
-        if state.lower() in state_mapping:
-            where_clause = "WHERE estado_campana = @estado"
-            query_params.append(
-                bigquery.ScalarQueryParameter("estado", "STRING", state_mapping[state.lower()])
-            )
-        elif state.lower() != "all":
-            raise ValueError(
-                f"Estado inválido: {state}. Debe ser 'all', 'active' o 'paused'"
-            )
-
-        data_query = f"""
-        {base_query}
-        {where_clause}
+        WHERE (ARRAY_LENGTH(@estados) = 0 OR estado_campana IN UNNEST(@estados))
         ORDER BY fecha_creacion DESC
         LIMIT @limit
         OFFSET @skip
         """
+        self._campaigns_count_sql = f"""
+        SELECT COUNT(*) as total
+        FROM `{self.table_id}`
+        WHERE (ARRAY_LENGTH(@estados) = 0 OR estado_campana IN UNNEST(@estados))
+        """
+
+    async def _run_query(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> list:
+        """Ejecutar una query de BigQuery fuera del event loop y devolver todas las filas"""
+        return await asyncio.to_thread(
+            lambda: list(self.client.query(sql, job_config=job_config).result())
+        )
 
-        query_params.extend([
+    async def _run_query_arrow(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> List[dict]:
+        """Ejecutar una query y descargar el resultado vía Storage Read API (Arrow)"""
+        bqstorage_client = bigquery_config.get_bqstorage_client()
+        table = await asyncio.to_thread(
+            lambda: self.client.query(sql, job_config=job_config)
+            .result()
+            .to_arrow(bqstorage_client=bqstorage_client)
+        )
+        return table.to_pylist()
+
+    async def _query_campaigns(
+        self, estados: List[str], skip: int, limit: int, cached_total: Optional[int]
+    ) -> tuple[List[CampaignInternal], int]:
+        """Traer una página de DIM_CAMPANA y su total (de la cache o de COUNT(*) OVER())"""
+        # Con el total en cache no hace falta la ventana COUNT(*) OVER()
+        total_column = "" if cached_total is not None else ",\n            COUNT(*) OVER() AS _total"
+        data_query = self._campaigns_sql_template.format(total_column=total_column)
+
+        estados_param = bigquery.ArrayQueryParameter("estados", "STRING", estados)
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            estados_param,
             bigquery.ScalarQueryParameter("limit", "INT64", limit),
             bigquery.ScalarQueryParameter("skip", "INT64", skip)
         ])
+        results = await self._run_query_arrow(data_query, job_config)
+        campaigns = [
+            CampaignInternal(**{k: v for k, v in row.items() if k != "_total"})
+            for row in results
+        ]
 
-        count_query = f"""
-        SELECT COUNT(*) as total
-        FROM `{self.table_id}`
-        {where_clause}
-        """
+        if cached_total is not None:
+            return campaigns, cached_total
+
+        if results:
+            total_count = results[0]["_total"]
+        elif skip > 0:
+            # Página fuera de rango: el total no viene en la respuesta, hacer el count aparte
+            count_job_config = bigquery.QueryJobConfig(query_parameters=[estados_param])
+            count_result = await self._run_query(self._campaigns_count_sql, count_job_config)
+            total_count = count_result[0].total
+        else:
+            total_count = 0
+
+        return campaigns, total_count
+
+    async def get_campaigns(
+        self, skip: int = 0, limit: int = 10, state: str = "all"
+    ) -> tuple[List[CampaignInternal], int]:
+        """Obtener todas las campañas con paginación"""
+        state_mapping = {
+            "active": "ACTIVA",
+            "paused": "INACTIVA",
+        }
+
+        cache_key = state.lower()
+        if cache_key in state_mapping:
+            estados = [state_mapping[cache_key]]
+        elif cache_key == "all":
+            estados = []
+        else:
+            raise ValueError(
+                f"Estado inválido: {state}. Debe ser 'all', 'active' o 'paused'"
+            )
 
         try:
-            job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            query_job = self.client.query(data_query, job_config=job_config)
-            results = query_job.result()
-            campaigns = [CampaignInternal(**dict(row)) for row in results]
-
-            # Para el count, solo usar el parámetro de estado si existe
-            count_params = [p for p in query_params if p.name == "estado"]
-            count_job_config = bigquery.QueryJobConfig(query_parameters=count_params) if count_params else None
-            count_job = self.client.query(count_query, job_config=count_job_config)
-            count_result = count_job.result()
-            total_count = list(count_result)[0].total
+            # Páginas dentro de las primeras PAGE_CACHE_ROWS filas: servir desde memoria
+            if skip + limit <= self.PAGE_CACHE_ROWS:
+                cached_page = self._page_cache.get(cache_key)
+                if cached_page is None:
+                    cached_page = await self._query_campaigns(
+                        estados, 0, self.PAGE_CACHE_ROWS, None
+                    )
+                    self._page_cache.set(cache_key, cached_page)
+                    self._count_cache.set(cache_key, cached_page[1])
+                campaigns, total_count = cached_page
+                return campaigns[skip:skip + limit], total_count
 
+            # Páginas profundas: query directa
+            cached_total = self._count_cache.get(cache_key)
+            campaigns, total_count = await self._query_campaigns(
+                estados, skip, limit, cached_total
+            )
+            if cached_total is None:
+                self._count_cache.set(cache_key, total_count)
             return campaigns, total_count
 
         except Exception as e:
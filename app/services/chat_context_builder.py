@@ -4,47 +4,99 @@ Chat context builder service.
 Loads relevant analysis data from BigQuery to provide context for AI chat responses.
 """
 
+import asyncio
 import logging
+import re
 from typing import Dict, Any, Optional, List
+import orjson
 from google.cloud import bigquery
 from datetime import datetime, timedelta
 from app.core.config import bigquery_config
 from app.core.config import settings
 from app.core.exceptions import DatabaseConnectionError
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# BigQuery label values: lowercase letters, digits, '_' and '-', up to 63 chars
+_LABEL_INVALID_CHARS = re.compile(r"[^a-z0-9_-]")
+
+
+def _label_value(value: str) -> str:
+    """Sanitize a string for use as a BigQuery job label value."""
+    return _LABEL_INVALID_CHARS.sub("_", value.lower())[:63]
+
 
 class ChatContextBuilder:
     """
     Builds context for chat sessions by loading relevant analysis data.
-    
+
     Context includes:
     - Sentiment summary from AI analysis
     - Emerging themes
     - Sample reviews (positive and negative)
     """
-    
+
     def __init__(self):
         """Initialize BigQuery client using config standard."""
         self.client = bigquery_config.get_client()
         self.reviews_table = bigquery_config.get_table_id("DIM_REVIEWS_HISTORICO")
         self.analysis_table = bigquery_config.get_table_id_with_dataset("AIOutput", "Reviews_Analysis")
         self.themes_table = bigquery_config.get_table_id_with_dataset("AIOutput", "EMERGING_THEMES")
+        # Assembled contexts keyed by (app_id, days_back); source data changes daily
+        self._context_cache = TTLCache(maxsize=512, ttl=settings.CONTEXT_CACHE_TTL)
+        # Fixed part of every context job config; only parameters and the app label vary
+        self._job_config_defaults = {
+            "use_query_cache": True,
+            "use_legacy_sql": False,
+            "priority": bigquery.QueryPriority.INTERACTIVE,
+        }
         logger.info("ChatContextBuilder initialized")
-    
+
+    def invalidate(self, app_id: str) -> None:
+        """
+        Drop every cached context for an app.
+
+        Call after new reviews or analyses for the app are ingested.
+        """
+        for key in [k for k in self._context_cache.keys() if k[0] == app_id]:
+            self._context_cache.pop(key)
+
+    async def _run_query(
+        self,
+        query: str,
+        job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Run a BigQuery query in a worker thread and return rows as dicts.
+
+        Results are downloaded through the Storage Read API (Arrow over gRPC),
+        which keeps nested review arrays cheap as sample sizes grow.
+        """
+        bqstorage_client = bigquery_config.get_bqstorage_client()
+        table = await asyncio.to_thread(
+            lambda: self.client.query(query, job_config=job_config)
+            .result()
+            .to_arrow(bqstorage_client=bqstorage_client)
+        )
+        return table.to_pylist()
+
     async def build_context(
         self,
         app_id: str,
-        days_back: int = 90
+        days_back: int = 90,
+        force_refresh: bool = False
     ) -> Dict[str, Any]:
         """
         Build chat context by loading analysis data for an app.
-        
+
+        Contexts are cached for CONTEXT_CACHE_TTL seconds per (app_id, days_back).
+
         Args:
             app_id: App identifier
             days_back: Number of days to look back for data (default: 90)
-        
+            force_refresh: Skip the cache and rebuild from BigQuery
+
         Returns:
             Dictionary with context data:
             {
@@ -54,20 +106,28 @@ class ChatContextBuilder:
                 "sample_reviews": {"positive": [...], "negative": [...]},
                 "stats": {"total_reviews": 100, "avg_rating": 4.2}
             }
-        
+
         Raises:
             DatabaseConnectionError: If query fails
         """
+        cache_key = (app_id, days_back)
+        if not force_refresh:
+            cached = self._context_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Using cached context for app {app_id}, last {days_back} days")
+                return dict(cached)
+
         logger.info(
             f"Building context for app {app_id}, last {days_back} days"
         )
-        
+
         try:
-            # Load data in parallel (conceptually - BigQuery executes sequentially)
-            sentiment_summary = await self._get_sentiment_summary(app_id, days_back)
-            emerging_themes = await self._get_emerging_themes(app_id)
-            sample_reviews = await self._get_sample_reviews(app_id, days_back)
-            stats = await self._get_app_stats(app_id, days_back)
+            row = await self._load_context_row(app_id, days_back)
+
+            sentiment_summary = self._parse_sentiment_summary(row)
+            emerging_themes = self._parse_emerging_themes(row)
+            sample_reviews = self._parse_sample_reviews(row)
+            stats = self._parse_app_stats(row, days_back)
 
             context = {
                 "app_id": app_id,
@@ -77,200 +137,191 @@ class ChatContextBuilder:
                 "stats": stats,
                 "context_generated_at": datetime.utcnow().isoformat()
             }
-            
+
             logger.info(
                 f"Context built successfully: {stats.get('total_reviews', 0)} reviews, "
                 f"{len(emerging_themes)} themes"
             )
-            
+
+            # Don't pin the empty fallback context in cache when the query failed
+            if row is not None:
+                self._context_cache.set(cache_key, context)
+
             return context
-            
+
         except Exception as e:
             logger.error(f"Error building context: {e}")
             raise DatabaseConnectionError(
                 f"Failed to build chat context for app {app_id}",
                 details={"app_id": app_id, "error": str(e)}
             )
-    
-    async def _get_sentiment_summary(
+
+    async def _load_context_row(
         self,
         app_id: str,
-        days_back: int
+        days_back: int,
+        sample_limit: int = 5,
+        preview_chars: int = 150
     ) -> Optional[Dict[str, Any]]:
         """
-        Get latest sentiment summary from AI analysis.
-        
-        Returns aggregated sentiment data from Reviews_Analysis table.
+        Load every context section with a single BigQuery job.
+
+        The reviews window is scanned once and shared by the stats and the
+        positive/negative samples; sentiment and themes come from their own CTEs.
+
+        Returns:
+            One row with sentiment_json, themes_json, total_reviews, avg_rating
+            and sample_reviews (tagged by sentiment, text cut to preview_chars),
+            or None if the query fails
         """
         query = f"""
-        WITH latest_analysis AS (
+        WITH reviews AS (
+            SELECT content, score, fecha
+            FROM `{self.reviews_table}`
+            WHERE app_id = @app_id
+              AND fecha >= @cutoff_date
+        ),
+        stats AS (
+            SELECT
+                COUNT(*) as total_reviews,
+                AVG(score) as avg_rating
+            FROM reviews
+        ),
+        samples AS (
+            -- Positive (4-5 stars) and negative (1-2 stars) samples in one pass,
+            -- newest @limit of each. Text is cut here so long reviews never leave BigQuery
             SELECT
-                json_data,
-                analyzed_at,
-                ROW_NUMBER() OVER (ORDER BY analyzed_at DESC) as rn
+                IF(score >= 4, 'positive', 'negative') as sentiment,
+                SUBSTR(content, 1, @preview_chars) as text,
+                LENGTH(content) > @preview_chars as truncated,
+                score as rating,
+                FORMAT_DATE('%Y-%m-%d', fecha) as date
+            FROM reviews
+            WHERE (score >= 4 OR score <= 2) AND LENGTH(content) > 50
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY score >= 4 ORDER BY fecha DESC) <= @limit
+        ),
+        latest_analysis AS (
+            -- Only the sub-document the chat needs, not the whole AI output blob
+            SELECT JSON_EXTRACT(json_data, '$.sentiment_summary') as sentiment_json
             FROM `{self.analysis_table}`
             WHERE app_id = @app_id
-              AND review_date >= DATE_SUB(CURRENT_DATE(), INTERVAL @days_back DAY)
+              AND review_date >= @cutoff_date
               AND JSON_EXTRACT_SCALAR(json_data, '$.sentiment_summary') IS NOT NULL
+            ORDER BY analyzed_at DESC
+            LIMIT 1
+        ),
+        latest_themes AS (
+            SELECT JSON_EXTRACT(json_data, '$.themes') as themes_json
+            FROM `{self.themes_table}`
+            WHERE app_id = @app_id
+            ORDER BY analyzed_at DESC
+            LIMIT 1
         )
-        SELECT json_data
-        FROM latest_analysis
-        WHERE rn = 1
+        SELECT
+            (SELECT sentiment_json FROM latest_analysis) as sentiment_json,
+            (SELECT themes_json FROM latest_themes) as themes_json,
+            stats.total_reviews,
+            stats.avg_rating,
+            ARRAY(SELECT AS STRUCT sentiment, text, truncated, rating, date FROM samples ORDER BY date DESC) as sample_reviews
+        FROM stats
         """
 
+        # Cutoff computed here instead of CURRENT_DATE(): non-deterministic functions
+        # disable BigQuery's result cache, a DATE parameter keeps it usable all day
+        cutoff_date = datetime.utcnow().date() - timedelta(days=days_back)
+
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
                 bigquery.ScalarQueryParameter("app_id", "STRING", app_id),
-                bigquery.ScalarQueryParameter("days_back", "INT64", days_back)
-            ]
+                bigquery.ScalarQueryParameter("cutoff_date", "DATE", cutoff_date),
+                bigquery.ScalarQueryParameter("limit", "INT64", sample_limit),
+                bigquery.ScalarQueryParameter("preview_chars", "INT64", preview_chars)
+            ],
+            labels={"service": "chat_context", "app_id": _label_value(app_id)},
+            **self._job_config_defaults
         )
-        
+
         try:
-            results = self.client.query(query, job_config=job_config).result()
-            row = next(results, None)
-            
-            if row and row.json_data:
-                import json
-                data = json.loads(row.json_data)
-                return data.get("sentiment_summary")
-            
+            rows = await self._run_query(query, job_config)
+            return rows[0] if rows else None
+
+        except Exception as e:
+            logger.warning(f"Error fetching chat context: {e}")
             return None
-            
+
+    def _parse_sentiment_summary(
+        self,
+        row: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Extract latest sentiment summary from AI analysis.
+
+        Returns aggregated sentiment data from Reviews_Analysis table.
+        """
+        try:
+            if row and row["sentiment_json"]:
+                return orjson.loads(row["sentiment_json"])
+
+            return None
+
         except Exception as e:
-            logger.warning(f"Error fetching sentiment summary: {e}")
+            logger.warning(f"Error parsing sentiment summary: {e}")
             return None
-    
-    async def _get_emerging_themes(
+
+    def _parse_emerging_themes(
         self,
-        app_id: str
+        row: Optional[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
         """
-        Get latest emerging themes from EMERGING_THEMES table.
-        
+        Extract latest emerging themes from EMERGING_THEMES table.
+
         Returns list of themes with their details.
         """
-        query = f"""
-        SELECT json_data
-        FROM `{self.themes_table}`
-        WHERE app_id = @app_id
-        ORDER BY analyzed_at DESC
-        LIMIT 1
-        """
-
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("app_id", "STRING", app_id)
-            ]
-        )
-        
         try:
-            results = self.client.query(query, job_config=job_config).result()
-            row = next(results, None)
-            
-            if row and row.json_data:
-                import json
-                data = json.loads(row.json_data)
-                return data.get("themes", [])
-            
+            if row and row["themes_json"]:
+                return orjson.loads(row["themes_json"]) or []
+
             return []
-            
+
         except Exception as e:
-            logger.warning(f"Error fetching emerging themes: {e}")
+            logger.warning(f"Error parsing emerging themes: {e}")
             return []
-    
-    async def _get_sample_reviews(
+
+    def _parse_sample_reviews(
         self,
-        app_id: str,
-        days_back: int,
-        limit: int = 5
+        row: Optional[Dict[str, Any]]
     ) -> Dict[str, List[Dict[str, Any]]]:
         """
-        Get sample positive and negative reviews.
-        
+        Extract sample positive and negative reviews.
+
         Returns:
             {
-                "positive": [{"text": "...", "rating": 5, "date": "..."}],
-                "negative": [{"text": "...", "rating": 1, "date": "..."}]
+                "positive": [{"text": "...", "truncated": False, "rating": 5, "date": "..."}],
+                "negative": [{"text": "...", "truncated": True, "rating": 1, "date": "..."}]
             }
         """
-        # Positive reviews (4-5 stars)
-        positive_query = f"""
-            SELECT
-                content as text,
-                score as rating,
-                fecha as date
-            FROM `{self.reviews_table}`
-            WHERE app_id = @app_id
-                AND score >= 4
-                AND fecha >= DATE_SUB(CURRENT_DATE(), INTERVAL @days_back DAY)
-                AND LENGTH(content) > 50
-            ORDER BY fecha DESC
-            LIMIT @limit
-        """
+        sample_reviews = {"positive": [], "negative": []}
+        if not row:
+            return sample_reviews
 
-        # Negative reviews (1-2 stars)
-        negative_query = f"""
-            SELECT
-                content as text,
-                score as rating,
-                fecha as date
-            FROM `{self.reviews_table}`
-            WHERE app_id = @app_id
-                AND score <= 2
-                AND fecha >= DATE_SUB(CURRENT_DATE(), INTERVAL @days_back DAY)
-                AND LENGTH(content) > 50
-            ORDER BY fecha DESC
-            LIMIT @limit
-        """
+        for review in row["sample_reviews"] or []:
+            sample_reviews[review["sentiment"]].append({
+                "text": review["text"],
+                "truncated": bool(review["truncated"]),
+                "rating": review["rating"],
+                "date": review["date"]
+            })
 
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("app_id", "STRING", app_id),
-                bigquery.ScalarQueryParameter("days_back", "INT64", days_back),
-                bigquery.ScalarQueryParameter("limit", "INT64", limit)
-            ]
-        )
-        
-        try:
-            # Get positive reviews
-            positive_results = self.client.query(positive_query, job_config=job_config).result()
-            positive_reviews = [
-                {
-                    "text": row.text,
-                    "rating": row.rating,
-                    "date": row.date.isoformat() if row.date else None
-                }
-                for row in positive_results
-            ]
-            
-            # Get negative reviews
-            negative_results = self.client.query(negative_query, job_config=job_config).result()
-            negative_reviews = [
-                {
-                    "text": row.text,
-                    "rating": row.rating,
-                    "date": row.date.isoformat() if row.date else None
-                }
-                for row in negative_results
-            ]
-            
-            return {
-                "positive": positive_reviews,
-                "negative": negative_reviews
-            }
-            
-        except Exception as e:
-            logger.warning(f"Error fetching sample reviews: {e}")
-            return {"positive": [], "negative": []}
-    
-    async def _get_app_stats(
+        return sample_reviews
+
+    def _parse_app_stats(
         self,
-        app_id: str,
+        row: Optional[Dict[str, Any]],
         days_back: int
     ) -> Dict[str, Any]:
         """
-        Get basic app statistics.
-        
+        Extract basic app statistics.
+
         Returns:
             {
                 "total_reviews": 1000,
@@ -278,39 +329,15 @@ class ChatContextBuilder:
                 "period_days": 90
             }
         """
-        query = f"""
-        SELECT
-            COUNT(*) as total_reviews,
-            AVG(score) as avg_rating
-        FROM `{self.reviews_table}`
-        WHERE app_id = @app_id
-          AND fecha >= DATE_SUB(CURRENT_DATE(), INTERVAL @days_back DAY)
-        """
+        if row:
+            return {
+                "total_reviews": int(row["total_reviews"]) if row["total_reviews"] else 0,
+                "avg_rating": float(row["avg_rating"]) if row["avg_rating"] else 0.0,
+                "period_days": days_back
+            }
+
+        return {"total_reviews": 0, "avg_rating": 0.0, "period_days": days_back}
 
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("app_id", "STRING", app_id),
-                bigquery.ScalarQueryParameter("days_back", "INT64", days_back)
-            ]
-        )
-        
-        try:
-            results = self.client.query(query, job_config=job_config).result()
-            row = next(results, None)
-            
-            if row:
-                return {
-                    "total_reviews": int(row.total_reviews) if row.total_reviews else 0,
-                    "avg_rating": float(row.avg_rating) if row.avg_rating else 0.0,
-                    "period_days": days_back
-                }
-            
-            return {"total_reviews": 0, "avg_rating": 0.0, "period_days": days_back}
-            
-        except Exception as e:
-            logger.warning(f"Error fetching app stats: {e}")
-            return {"total_reviews": 0, "avg_rating": 0.0, "period_days": days_back}
-    
     # validate_app_ownership removido temporalmente
 
 
@@ -4,9 +4,14 @@ Chat service with OpenAI integration.
 Handles AI-powered chat responses using OpenAI's Chat API with streaming support.
 """
 
+import asyncio
+import hashlib
 import logging
 import json
+import time
+from collections import OrderedDict
 from typing import AsyncGenerator, Dict, Any, List
+import httpx
 from openai import AsyncOpenAI
 
 from app.core.config import settings
@@ -15,6 +20,25 @@ from app.core.exceptions import BoomitAPIException
 
 logger = logging.getLogger(__name__)
 
+# Streamed deltas are flushed once this many chars are buffered or this much time passed
+STREAM_FLUSH_CHARS = 64
+STREAM_FLUSH_SECONDS = 0.03
+
+# Rough chars-per-token ratio used to estimate prompt size without a tokenizer
+_CHARS_PER_TOKEN = 4
+
+# Constant trailing block of the system prompt
+_GUIDELINES = """
+**Instrucciones:**
+- Responde en español de manera clara y concisa
+- Usa los datos de contexto para fundamentar tus respuestas
+- Si no tienes información suficiente, indícalo claramente
+- Mantén un tono profesional y objetivo
+- Prioriza insights accionables y recomendaciones prácticas
+- Si el usuario pregunta por datos numéricos específicos, usa las estadísticas disponibles
+- Enfócate en análisis de negocio y experiencia de usuario
+"""
+
 
 class ChatService:
     """
@@ -28,14 +52,67 @@ class ChatService:
     
     def __init__(self):
         """Initialize OpenAI client"""
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        # Pooled HTTP/2 transport shared by every chat request
+        self._http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+        self.client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=self._http_client
+        )
+        # Cap in-flight completions so bursts queue here instead of hitting rate limits
+        self._semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
         self.model = getattr(settings, "OPENAI_CHAT_MODEL", "gpt-4o-mini")
         
+        # System message per session (context is fixed for the session's lifetime),
+        # deduplicated by prompt hash so sessions on the same app share one dict.
+        # Bounded LRUs so long-running processes don't grow without limit.
+        self._prompt_cache: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._system_messages: "OrderedDict[bytes, Dict[str, str]]" = OrderedDict()
+        # Already-built history message dicts per session; sessions are append-only
+        self._history_cache: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+        self._prompt_cache_size = 1024
+        
         logger.info(f"ChatService initialized with model: {self.model}")
     
     def _build_system_prompt(self, context: Dict[str, Any]) -> str:
         """
-        Build system prompt with loaded context.
+        Build system prompt with loaded context, trimmed to PROMPT_TOKEN_BUDGET.
+        
+        Review samples are dropped first, then themes from the tail, until the
+        estimated token count fits the budget.
+        """
+        max_themes, max_samples = 5, 3
+        prompt = self._render_system_prompt(context, max_themes, max_samples)
+        
+        while (
+            len(prompt) // _CHARS_PER_TOKEN > settings.PROMPT_TOKEN_BUDGET
+            and (max_themes or max_samples)
+        ):
+            if max_samples:
+                max_samples -= 1
+            else:
+                max_themes -= 1
+            prompt = self._render_system_prompt(context, max_themes, max_samples)
+        
+        if max_themes < 5 or max_samples < 3:
+            logger.info(
+                f"System prompt trimmed to {max_themes} themes and {max_samples} samples "
+                f"to fit {settings.PROMPT_TOKEN_BUDGET} tokens"
+            )
+        
+        return prompt
+    
+    def _render_system_prompt(
+        self,
+        context: Dict[str, Any],
+        max_themes: int,
+        max_samples: int
+    ) -> str:
+        """
+        Render the system prompt with the given number of themes and samples.
         
         Creates a comprehensive system message that includes:
         - Role definition
@@ -47,83 +124,119 @@ class ChatService:
         sentiment = context.get("sentiment_summary", {})
         themes = context.get("emerging_themes", [])
         samples = context.get("sample_reviews", {})
+        avg_rating = f"{stats.get('avg_rating', 0):.2f}"
         
         # Build context summary
-        context_summary = f"""
+        parts: List[str] = [f"""
 Eres un asistente de análisis de reviews de aplicaciones móviles. Tu rol es ayudar a analizar y responder preguntas sobre las reviews de la aplicación.
 
 **App analizada:** {app_id}
 **Período de análisis:** Últimos {stats.get('period_days', 30)} días
 **Total de reviews:** {stats.get('total_reviews', 0)}
-**Rating promedio:** {stats.get('avg_rating', 0):.2f}/5.0
+**Rating promedio:** {avg_rating}/5.0
 
 **Resumen de Sentimiento:**
-"""
+"""]
         
         # Add sentiment data if available
         if sentiment:
             if isinstance(sentiment, dict):
                 for key, value in sentiment.items():
-                    context_summary += f"- {key}: {value}\n"
+                    parts.append(f"- {key}: {value}\n")
             else:
-                context_summary += f"{sentiment}\n"
+                parts.append(f"{sentiment}\n")
         else:
-            context_summary += "No hay datos de sentimiento disponibles.\n"
+            parts.append("No hay datos de sentimiento disponibles.\n")
         
-        context_summary += "\n**Temas Emergentes:**\n"
+        parts.append("\n**Temas Emergentes:**\n")
         
         # Add themes if available
         if themes:
-            for i, theme in enumerate(themes[:5], 1):  # Top 5 themes
+            for i, theme in enumerate(themes[:max_themes], 1):  # Top themes
                 if isinstance(theme, dict):
                     theme_name = theme.get("theme", theme.get("name", "Tema"))
                     count = theme.get("count", "N/A")
-                    context_summary += f"{i}. {theme_name} (menciones: {count})\n"
+                    parts.append(f"{i}. {theme_name} (menciones: {count})\n")
                 else:
-                    context_summary += f"{i}. {theme}\n"
+                    parts.append(f"{i}. {theme}\n")
         else:
-            context_summary += "No hay temas emergentes identificados.\n"
+            parts.append("No hay temas emergentes identificados.\n")
         
-        context_summary += "\n**Ejemplos de Reviews Positivas:**\n"
+        parts.append("\n**Ejemplos de Reviews Positivas:**\n")
         
         # Add positive review samples
         positive_reviews = samples.get("positive", [])
         if positive_reviews:
-            for i, review in enumerate(positive_reviews[:3], 1):  # Top 3
+            for i, review in enumerate(positive_reviews[:max_samples], 1):
                 text = review.get("text", "")
                 rating = review.get("rating", "N/A")
-                # Truncate long reviews
-                text_preview = text[:150] + "..." if len(text) > 150 else text
-                context_summary += f"{i}. [{rating}⭐] {text_preview}\n"
+                # Text already cut server-side; mark it when the review was longer
+                text_preview = text + "..." if review.get("truncated") else text
+                parts.append(f"{i}. [{rating}⭐] {text_preview}\n")
         else:
-            context_summary += "No hay reviews positivas disponibles.\n"
+            parts.append("No hay reviews positivas disponibles.\n")
         
-        context_summary += "\n**Ejemplos de Reviews Negativas:**\n"
+        parts.append("\n**Ejemplos de Reviews Negativas:**\n")
         
         # Add negative review samples
         negative_reviews = samples.get("negative", [])
         if negative_reviews:
-            for i, review in enumerate(negative_reviews[:3], 1):  # Top 3
+            for i, review in enumerate(negative_reviews[:max_samples], 1):
                 text = review.get("text", "")
                 rating = review.get("rating", "N/A")
-                text_preview = text[:150] + "..." if len(text) > 150 else text
-                context_summary += f"{i}. [{rating}⭐] {text_preview}\n"
+                text_preview = text + "..." if review.get("truncated") else text
+                parts.append(f"{i}. [{rating}⭐] {text_preview}\n")
         else:
-            context_summary += "No hay reviews negativas disponibles.\n"
+            parts.append("No hay reviews negativas disponibles.\n")
         
         # Add guidelines
-        context_summary += """
-**Instrucciones:**
-- Responde en español de manera clara y concisa
-- Usa los datos de contexto para fundamentar tus respuestas
-- Si no tienes información suficiente, indícalo claramente
-- Mantén un tono profesional y objetivo
-- Prioriza insights accionables y recomendaciones prácticas
-- Si el usuario pregunta por datos numéricos específicos, usa las estadísticas disponibles
-- Enfócate en análisis de negocio y experiencia de usuario
-"""
+        parts.append(_GUIDELINES)
+        
+        return "".join(parts)
+    
+    async def aclose(self) -> None:
+        """Close the shared HTTP transport (called on app shutdown)."""
+        await self._http_client.aclose()
+    
+    def _lru_put(self, cache: OrderedDict, key: Any, value: Any) -> None:
+        """Insert into one of the bounded LRU caches, evicting the oldest entry."""
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self._prompt_cache_size:
+            cache.popitem(last=False)
+    
+    def _get_system_message(self, session: ChatSession) -> Dict[str, str]:
+        """
+        Return the session's system message, building the prompt only on the first turn.
+        
+        Reusing the exact same string keeps the message prefix byte-identical
+        across turns, so OpenAI's automatic prompt caching can kick in.
+        """
+        message = self._prompt_cache.get(session.session_id)
+        if message is not None:
+            self._prompt_cache.move_to_end(session.session_id)
+            return message
         
-        return context_summary
+        prompt = self._build_system_prompt(session.context)
+        prompt_hash = hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+        message = self._system_messages.get(prompt_hash)
+        if message is None:
+            message = {"role": "system", "content": prompt}
+        self._lru_put(self._system_messages, prompt_hash, message)
+        self._lru_put(self._prompt_cache, session.session_id, message)
+        return message
+    
+    def _get_history(self, session: ChatSession) -> List[Dict[str, str]]:
+        """
+        Return the session history as message dicts, converting only new messages.
+        """
+        history = self._history_cache.get(session.session_id)
+        if history is None or len(history) > len(session.messages):
+            history = []
+        for msg in session.messages[len(history):]:
+            history.append({"role": msg.role, "content": msg.content})
+        self._lru_put(self._history_cache, session.session_id, history)
+        return history
     
     def _prepare_messages(
         self,
@@ -138,21 +251,8 @@ Eres un asistente de análisis de reviews de aplicaciones móviles. Tu rol es ay
         - Conversation history
         - New user message
         """
-        messages = []
-        
-        # Add system prompt with context
-        system_prompt = self._build_system_prompt(session.context)
-        messages.append({
-            "role": "system",
-            "content": system_prompt
-        })
-        
-        # Add conversation history
-        for msg in session.messages:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+        # System prompt with context, then conversation history (both cached)
+        messages = [self._get_system_message(session), *self._get_history(session)]
         
         # Add new user message
         messages.append({
@@ -175,7 +275,7 @@ Eres un asistente de análisis de reviews de aplicaciones móviles. Tu rol es ay
             user_message: New message from user
         
         Yields:
-            Response tokens as they arrive
+            Response text in small coalesced chunks (~64 chars / 30 ms)
         
         Raises:
             BoomitAPIException: If OpenAI API call fails
@@ -188,22 +288,40 @@ Eres un asistente de análisis de reviews de aplicaciones móviles. Tu rol es ay
         )
         
         try:
-            # Call OpenAI with streaming
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=True,
-                temperature=0.7,
-                max_tokens=1000
-            )
+            # Hold a concurrency slot for the whole stream
+            async with self._semaphore:
+                # Call OpenAI with streaming
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    temperature=0.7,
+                    max_tokens=1000
+                )
+            
+                # Stream tokens, coalesced into small chunks to cut per-frame overhead
+                buffer: List[str] = []
+                buffered_chars = 0
+                last_flush = time.monotonic()
+                async for chunk in stream:
+                    # Extract content delta
+                    if chunk.choices and len(chunk.choices) > 0:
+                        delta = chunk.choices[0].delta
+                        if delta.content:
+                            buffer.append(delta.content)
+                            buffered_chars += len(delta.content)
+                            now = time.monotonic()
+                            if (
+                                buffered_chars >= STREAM_FLUSH_CHARS
+                                or now - last_flush >= STREAM_FLUSH_SECONDS
+                            ):
+                                yield "".join(buffer)
+                                buffer.clear()
+                                buffered_chars = 0
+                                last_flush = now
             
-            # Stream tokens
-            async for chunk in stream:
-                # Extract content delta
-                if chunk.choices and len(chunk.choices) > 0:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        yield delta.content
+                if buffer:
+                    yield "".join(buffer)
             
             logger.info(f"Streaming completed for session {session.session_id}")
             
@@ -245,13 +363,14 @@ Eres un asistente de análisis de reviews de aplicaciones móviles. Tu rol es ay
         
         try:
             # Call OpenAI without streaming
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=False,
-                temperature=0.7,
-                max_tokens=1000
-            )
+            async with self._semaphore:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=False,
+                    temperature=0.7,
+                    max_tokens=1000
+                )
             
             # Extract response text
             if response.choices and len(response.choices) > 0:
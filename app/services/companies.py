@@ -1,23 +1,101 @@
 from typing import List, Optional
+import asyncio
+import functools
 from google.cloud import bigquery
 from app.core.exceptions import DatabaseConnectionError
 from app.schemas.companies import CompanyResponse, CompanyInternal, CompanyCreateRequest, CompanyUpdateRequest
-from datetime import datetime
-from app.core.config import bigquery_config
-import uuid
+from datetime import date, datetime, time, timezone
+from app.core.config import bigquery_config, settings
+from app.utils.cache import TTLCache
+from app.utils.singleflight import SingleFlight
+import secrets
+
+
+def _id_param(empresa_id: str) -> bigquery.ScalarQueryParameter:
+    """Parámetro @empresa_id usado por las queries de una sola empresa"""
+    return bigquery.ScalarQueryParameter("empresa_id", "STRING", empresa_id)
+
+
+def _bq_call(error_key: str):
+    """
+    Envolver cualquier error de un método del servicio en DatabaseConnectionError.
+
+    Un DatabaseConnectionError ya construido (p. ej. de otro método decorado llamado
+    desde este) se propaga tal cual, sin volver a envolverlo.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except DatabaseConnectionError:
+                raise
+            except Exception as e:
+                raise DatabaseConnectionError(details={error_key: str(e)})
+        return wrapper
+    return decorator
+
+
+def _as_date_midnight(value: Optional[datetime]) -> Optional[datetime]:
+    """Truncar un datetime al inicio del día, como queda al guardarlo en una columna DATE"""
+    return datetime.combine(value.date(), time.min) if value else None
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    """Columnas DATE llegan como datetime.date; el modelo las tipa como datetime"""
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, time.min)
+    return value
+
+
+def _company_from_row(row) -> CompanyInternal:
+    """
+    Construir CompanyInternal desde una fila de empresas (bigquery.Row o dict).
+
+    Único camino de hidratación para listado, lectura por id y alta: toma solo los
+    campos del modelo por nombre (una columna faltante falla, una extra se ignora)
+    y normaliza las fechas de relación DATE a datetime.
+    """
+    return CompanyInternal.model_construct(
+        empresa_id=row["empresa_id"],
+        nombre_empresa=row["nombre_empresa"],
+        pais=row["pais"],
+        industria=row["industria"],
+        fecha_inicio_relacion=_as_datetime(row["fecha_inicio_relacion"]),
+        fecha_fin_relacion=_as_datetime(row["fecha_fin_relacion"]),
+        estado_empresa=row["estado_empresa"],
+        motivo_cierre=row["motivo_cierre"],
+        fecha_creacion=row["fecha_creacion"],
+        fecha_actualizacion=row["fecha_actualizacion"],
+    )
 
 
 class CompanyService:
+    # Segundos que se reutiliza el total de empresas entre páginas
+    COUNT_CACHE_TTL = 30
+
+    # Campos actualizables: (atributo/columna, tipo BigQuery, conversión del valor)
+    _UPDATABLE = (
+        ("nombre_empresa", "STRING", lambda v: v),
+        ("pais", "STRING", lambda v: v),
+        ("industria", "STRING", lambda v: v),
+        ("fecha_inicio_relacion", "DATE", lambda v: v.date()),
+        ("fecha_fin_relacion", "DATE", lambda v: v.date()),
+        ("estado_empresa", "STRING", lambda v: v),
+        ("motivo_cierre", "STRING", lambda v: v),
+    )
+
     def __init__(self):
         self.client = bigquery_config.get_client()
         self.table_id = bigquery_config.get_table_id("DIM_EMPRESA")
-
-    async def get_companies(
-        self, skip: int = 0, limit: int = 10
-    ) -> tuple[List[CompanyInternal], int]:
-        """Obtener todas las empresas con paginación"""
-        query = f"""
-        SELECT 
+        self._count_cache = TTLCache(maxsize=256, ttl=self.COUNT_CACHE_TTL)
+        # Una tarea por filtro en vuelo: un solo COUNT(*) por clave, sin bloquear otras claves
+        self._count_flight = SingleFlight()
+        # Tope de queries en vuelo para que las ráfagas esperen aquí y no en el pool HTTP
+        self._semaphore = asyncio.Semaphore(settings.BQ_MAX_CONCURRENT_QUERIES)
+
+        # SQL precompilado: el texto es idéntico entre llamadas y solo varían los parámetros
+        columns = """
             empresa_id,
             nombre_empresa,
             pais,
@@ -27,85 +105,41 @@ class CompanyService:
             estado_empresa,
             motivo_cierre,
             fecha_creacion,
-            fecha_actualizacion
+            fecha_actualizacion"""
+        self._companies_page_sql = f"""
+        SELECT {columns}
         FROM `{self.table_id}`
-        ORDER BY fecha_creacion DESC, empresa_id ASC
-        LIMIT {int(limit)}
-        OFFSET {int(skip)}
+        ORDER BY fecha_creacion DESC NULLS LAST, empresa_id ASC
+        LIMIT @limit
+        OFFSET @skip
         """
-
-        query_params = []
-
-        count_query = f"SELECT COUNT(*) as total FROM `{self.table_id}`"
-
-        try:
-            job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            query_job = self.client.query(query, job_config=job_config)
-            results = query_job.result()
-            companies = [CompanyInternal(**dict(row)) for row in results]
-
-            count_job = self.client.query(count_query)
-            count_result = count_job.result()
-            total_count = list(count_result)[0].total
-
-            return companies, total_count
-
-        except Exception as e:
-            raise DatabaseConnectionError(details={"Company service error": str(e)})
-
-    async def get_company_by_id(self, empresa_id: str) -> Optional[CompanyInternal]:
-        """Obtener una empresa por su ID"""
-        query = f"""
-        SELECT 
-            empresa_id,
-            nombre_empresa,
-            pais,
-            industria,
-            fecha_inicio_relacion,
-            fecha_fin_relacion,
-            estado_empresa,
-            motivo_cierre,
-            fecha_creacion,
-            fecha_actualizacion
+        # Filas sin fecha_creacion van al final (NULLS LAST); un cursor con fecha NULL
+        # sigue solo entre ellas por empresa_id
+        self._companies_keyset_sql = f"""
+        SELECT {columns}
+        FROM `{self.table_id}`
+        WHERE (@after_fecha IS NOT NULL
+               AND (fecha_creacion < @after_fecha
+                    OR (fecha_creacion = @after_fecha AND empresa_id > @after_id)
+                    OR fecha_creacion IS NULL))
+           OR (@after_fecha IS NULL
+               AND fecha_creacion IS NULL AND empresa_id > @after_id)
+        ORDER BY fecha_creacion DESC NULLS LAST, empresa_id ASC
+        LIMIT @limit
+        """
+        # Total sin filtros desde metadatos de la tabla: no escanea DIM_EMPRESA
+        self._companies_count_sql = f"""
+        SELECT row_count as total
+        FROM `{bigquery_config.get_table_id("__TABLES__")}`
+        WHERE table_id = 'DIM_EMPRESA'
+        """
+        self._company_by_id_sql = f"""
+        SELECT {columns}
         FROM `{self.table_id}`
         WHERE empresa_id = @empresa_id
         """
-
-        query_params = [
-            bigquery.ScalarQueryParameter("empresa_id", "STRING", empresa_id)
-        ]
-
-        try:
-            job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            query_job = self.client.query(query, job_config=job_config)
-            results = query_job.result()
-            
-            rows = list(results)
-            if not rows:
-                return None
-            
-            return CompanyInternal(**dict(rows[0]))
-
-        except Exception as e:
-            raise DatabaseConnectionError(details={"Company service error": str(e)})
-
-    async def create_company(self, company_data: CompanyCreateRequest) -> CompanyInternal:
-        """Crear una nueva empresa"""
-        empresa_id = f"ee{str(uuid.uuid4())[:8]}"
-        now = datetime.utcnow()
-
-        query = f"""
-        INSERT INTO `{self.table_id}` (
-            empresa_id,
-            nombre_empresa,
-            pais,
-            industria,
-            fecha_inicio_relacion,
-            fecha_fin_relacion,
-            estado_empresa,
-            motivo_cierre,
-            fecha_creacion,
-            fecha_actualizacion
+        self._company_insert_sql = f"""
+        INSERT INTO `{self.table_id}` ({columns}
         ) VALUES (
             @empresa_id,
             @nombre_empresa,
@@ -119,9 +153,124 @@ class CompanyService:
             @fecha_actualizacion
         )
         """
+        self._company_delete_sql = f"""
+        DELETE FROM `{self.table_id}`
+        WHERE empresa_id = @empresa_id
+        """
+
+    def invalidate_counts(self) -> None:
+        """Descartar totales cacheados (llamar tras cualquier escritura en DIM_EMPRESA)"""
+        self._count_cache.clear()
+
+    async def _run_query(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> list:
+        """Ejecutar una query de BigQuery fuera del event loop y devolver todas las filas"""
+        async with self._semaphore:
+            return await asyncio.to_thread(
+                lambda: list(self.client.query(sql, job_config=job_config).result())
+            )
+
+    async def _run_job(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> bigquery.QueryJob:
+        """Ejecutar una query (o DML) fuera del event loop y devolver el job terminado"""
+        def run():
+            job = self.client.query(sql, job_config=job_config)
+            job.result()
+            return job
+
+        async with self._semaphore:
+            return await asyncio.to_thread(run)
+
+    async def _cached_count(
+        self, key: tuple, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> int:
+        """
+        Total de filas para un filtro, cacheado COUNT_CACHE_TTL segundos.
+
+        Un solo COUNT(*) en vuelo por clave: las requests concurrentes que fallan
+        la cache para el mismo filtro comparten la misma tarea hasta que termina;
+        los misses de otros filtros no esperan.
+        """
+        total = self._count_cache.get(key)
+        if total is not None:
+            return total
+        return await self._count_flight.do(key, lambda: self._load_count(key, sql, job_config))
+
+    async def _load_count(
+        self, key: tuple, sql: str, job_config: Optional[bigquery.QueryJobConfig]
+    ) -> int:
+        """Ejecutar el COUNT(*) de una clave y guardarlo en la cache"""
+        rows = await self._run_query(sql, job_config)
+        total = rows[0].total if rows else 0
+        self._count_cache.set(key, total)
+        return total
+
+    async def _fetch_page(
+        self, sql: str, job_config: bigquery.QueryJobConfig, limit: int
+    ) -> List[dict]:
+        """Traer exactamente una página en una sola llamada, decodificada a Arrow"""
+        async with self._semaphore:
+            table = await asyncio.to_thread(
+                lambda: self.client.query(sql, job_config=job_config)
+                .result(page_size=limit, max_results=limit)
+                .to_arrow(create_bqstorage_client=False)
+            )
+        return table.to_pylist()
+
+    @_bq_call("Company service error")
+    async def get_companies(
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        after: Optional[tuple[Optional[datetime], str]] = None,
+    ) -> tuple[List[CompanyInternal], int]:
+        """
+        Obtener todas las empresas con paginación.
+
+        Con `after` (fecha_creacion, empresa_id de la última fila de la página anterior)
+        se pagina por keyset y se ignora `skip`; sin él se mantiene el OFFSET.
+        """
+        query = self._companies_keyset_sql if after is not None else self._companies_page_sql
+
+        query_params = [bigquery.ScalarQueryParameter("limit", "INT64", limit)]
+        if after is not None:
+            query_params += [
+                bigquery.ScalarQueryParameter("after_fecha", "TIMESTAMP", after[0]),
+                bigquery.ScalarQueryParameter("after_id", "STRING", after[1])
+            ]
+        else:
+            query_params.append(bigquery.ScalarQueryParameter("skip", "INT64", skip))
+
+        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
+        # Página y total corren en paralelo en BigQuery
+        rows, total_count = await asyncio.gather(
+            self._fetch_page(query, job_config, limit),
+            self._cached_count((self.table_id,), self._companies_count_sql),
+        )
+        companies = [_company_from_row(row) for row in rows]
+
+        return companies, total_count
+
+    @_bq_call("Company service error")
+    async def get_company_by_id(self, empresa_id: str) -> Optional[CompanyInternal]:
+        """Obtener una empresa por su ID"""
+        job_config = bigquery.QueryJobConfig(query_parameters=[_id_param(empresa_id)])
+        rows = await self._run_query(self._company_by_id_sql, job_config)
+        if not rows:
+            return None
+        
+        return _company_from_row(rows[0])
+
+    @_bq_call("Company service error")
+    async def create_company(self, company_data: CompanyCreateRequest) -> CompanyInternal:
+        """Crear una nueva empresa"""
+        empresa_id = f"ee{secrets.token_hex(4)}"
+        now = datetime.now(timezone.utc)
 
         query_params = [
-            bigquery.ScalarQueryParameter("empresa_id", "STRING", empresa_id),
+            _id_param(empresa_id),
             bigquery.ScalarQueryParameter("nombre_empresa", "STRING", company_data.nombre_empresa),
             bigquery.ScalarQueryParameter("pais", "STRING", company_data.pais),
             bigquery.ScalarQueryParameter("industria", "STRING", company_data.industria),
@@ -133,111 +282,72 @@ class CompanyService:
             bigquery.ScalarQueryParameter("fecha_actualizacion", "TIMESTAMP", now)
         ]
 
-        try:
-            job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            query_job = self.client.query(query, job_config=job_config)
-            query_job.result()
-
-            # Retrieve the created company
-            created_company = await self.get_company_by_id(empresa_id)
-            if not created_company:
-                raise DatabaseConnectionError(details={"Company service error": "Failed to retrieve created company"})
-            
-            return created_company
-
-        except Exception as e:
-            raise DatabaseConnectionError(details={"Company service error": str(e)})
-
+        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
+        await self._run_job(self._company_insert_sql, job_config)
+        self.invalidate_counts()
+
+        # Devolver lo insertado sin volver a leerlo; las fechas de relación se guardan
+        # como DATE, así que se truncan igual que al leerlas de la tabla
+        return _company_from_row({
+            "empresa_id": empresa_id,
+            "nombre_empresa": company_data.nombre_empresa,
+            "pais": company_data.pais,
+            "industria": company_data.industria,
+            "fecha_inicio_relacion": _as_date_midnight(company_data.fecha_inicio_relacion),
+            "fecha_fin_relacion": _as_date_midnight(company_data.fecha_fin_relacion),
+            "estado_empresa": company_data.estado_empresa,
+            "motivo_cierre": company_data.motivo_cierre,
+            "fecha_creacion": now,
+            "fecha_actualizacion": now,
+        })
+
+    @_bq_call("Company service error")
     async def update_company(self, empresa_id: str, company_data: CompanyUpdateRequest) -> Optional[CompanyInternal]:
-        """Actualizar una empresa existente"""
-        # First check if company exists
-        existing_company = await self.get_company_by_id(empresa_id)
-        if not existing_company:
-            return None
-
+        """Actualizar una empresa existente (None si no existe)"""
         # Build dynamic update query based on provided fields
         update_fields = []
         query_params = [
-            bigquery.ScalarQueryParameter("empresa_id", "STRING", empresa_id),
-            bigquery.ScalarQueryParameter("fecha_actualizacion", "TIMESTAMP", datetime.utcnow())
+            _id_param(empresa_id),
+            bigquery.ScalarQueryParameter("fecha_actualizacion", "TIMESTAMP", datetime.now(timezone.utc))
         ]
 
-        if company_data.nombre_empresa is not None:
-            update_fields.append("nombre_empresa = @nombre_empresa")
-            query_params.append(bigquery.ScalarQueryParameter("nombre_empresa", "STRING", company_data.nombre_empresa))
-        
-        if company_data.pais is not None:
-            update_fields.append("pais = @pais")
-            query_params.append(bigquery.ScalarQueryParameter("pais", "STRING", company_data.pais))
-        
-        if company_data.industria is not None:
-            update_fields.append("industria = @industria")
-            query_params.append(bigquery.ScalarQueryParameter("industria", "STRING", company_data.industria))
-        
-        if company_data.fecha_inicio_relacion is not None:
-            update_fields.append("fecha_inicio_relacion = @fecha_inicio_relacion")
-            query_params.append(bigquery.ScalarQueryParameter("fecha_inicio_relacion", "DATE", company_data.fecha_inicio_relacion.date()))
-        
-        if company_data.fecha_fin_relacion is not None:
-            update_fields.append("fecha_fin_relacion = @fecha_fin_relacion")
-            query_params.append(bigquery.ScalarQueryParameter("fecha_fin_relacion", "DATE", company_data.fecha_fin_relacion.date()))
-        
-        if company_data.estado_empresa is not None:
-            update_fields.append("estado_empresa = @estado_empresa")
-            query_params.append(bigquery.ScalarQueryParameter("estado_empresa", "STRING", company_data.estado_empresa))
-        
-        if company_data.motivo_cierre is not None:
-            update_fields.append("motivo_cierre = @motivo_cierre")
-            query_params.append(bigquery.ScalarQueryParameter("motivo_cierre", "STRING", company_data.motivo_cierre))
+        for attr, bq_type, transform in self._UPDATABLE:
+            value = getattr(company_data, attr)
+            if value is not None:
+                update_fields.append(f"{attr} = @{attr}")
+                query_params.append(bigquery.ScalarQueryParameter(attr, bq_type, transform(value)))
 
         # Always update fecha_actualizacion
         update_fields.append("fecha_actualizacion = @fecha_actualizacion")
 
-        if not update_fields:
-            return existing_company
-
         query = f"""
         UPDATE `{self.table_id}`
         SET {', '.join(update_fields)}
         WHERE empresa_id = @empresa_id
         """
 
-        try:
-            job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            query_job = self.client.query(query, job_config=job_config)
-            query_job.result()
+        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
+        query_job = await self._run_job(query, job_config)
 
-            # Retrieve the updated company
-            updated_company = await self.get_company_by_id(empresa_id)
-            return updated_company
+        # Sin filas afectadas: la empresa no existe, no hace falta consultarla antes
+        if not query_job.num_dml_affected_rows:
+            return None
 
-        except Exception as e:
-            raise DatabaseConnectionError(details={"Company service error": str(e)})
+        # Retrieve the updated company
+        updated_company = await self.get_company_by_id(empresa_id)
+        return updated_company
 
+    @_bq_call("Company service error")
     async def delete_company(self, empresa_id: str) -> bool:
-        """Eliminar una empresa"""
-        # First check if company exists
-        existing_company = await self.get_company_by_id(empresa_id)
-        if not existing_company:
-            return False
+        """Eliminar una empresa (False si no existe)"""
+        job_config = bigquery.QueryJobConfig(query_parameters=[_id_param(empresa_id)])
+        query_job = await self._run_job(self._company_delete_sql, job_config)
 
-        query = f"""
-        DELETE FROM `{self.table_id}`
-        WHERE empresa_id = @empresa_id
-        """
-
-        query_params = [
-            bigquery.ScalarQueryParameter("empresa_id", "STRING", empresa_id)
-        ]
-
-        try:
-            job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            query_job = self.client.query(query, job_config=job_config)
-            query_job.result()
-            return True
+        if not query_job.num_dml_affected_rows:
+            return False
 
-        except Exception as e:
-            raise DatabaseConnectionError(details={"Company service error": str(e)})
+        self.invalidate_counts()
+        return True
 
 
 company_service = CompanyService()
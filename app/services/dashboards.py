@@ -1,25 +1,51 @@
 from typing import List, Optional
+import asyncio
 from google.cloud import bigquery
 from app.core.exceptions import DatabaseConnectionError
 from app.schemas.dashboards import DashboardResponse, DashboardInternal, DashboardUpdateRequest, DashboardCreateRequest
 from datetime import datetime
-from app.core.config import bigquery_config
+from app.core.config import bigquery_config, settings
+from app.utils.cache import TTLCache
+from app.utils.singleflight import SingleFlight
+
+
+def _dashboard_from_row(row) -> DashboardInternal:
+    """
+    Construir DashboardInternal desde una fila de dashboards (bigquery.Row o dict).
+
+    Único camino de hidratación para listado y búsqueda por producto: toma los campos
+    del modelo por nombre, así no depende del orden de columnas del SELECT.
+    """
+    return DashboardInternal.model_construct(
+        dashboard_id=row["dashboard_id"],
+        empresa_id=row["empresa_id"],
+        producto_id=row["producto_id"],
+        nombre_dashboard=row["nombre_dashboard"],
+        nombre_empresa=row["nombre_empresa"],
+        url=row["url"],
+        embed_url=row["embed_url"],
+        estado=row["estado"],
+        fecha_creacion=row["fecha_creacion"],
+        fecha_actualizacion=row["fecha_actualizacion"],
+    )
 
 
 class DashboardService:
+    # Segundos que se reutiliza el total por filtro entre páginas
+    COUNT_CACHE_TTL = 30
+
     def __init__(self):
         self.client = bigquery_config.get_client()
         self.table_id = bigquery_config.get_table_id("DIM_MAESTRO_DASH")
+        self._count_cache = TTLCache(maxsize=256, ttl=self.COUNT_CACHE_TTL)
+        # Una tarea por filtro en vuelo: un solo COUNT(*) por clave, sin bloquear otras claves
+        self._count_flight = SingleFlight()
+        # Tope de queries en vuelo para que las ráfagas esperen aquí y no en el pool HTTP
+        self._semaphore = asyncio.Semaphore(settings.BQ_MAX_CONCURRENT_QUERIES)
 
-    async def get_dashboards(
-        self,
-        skip: int = 0,
-        limit: int = 10,
-        company_id: Optional[str] = None,
-        product_id: Optional[str] = None,
-    ) -> tuple[List[DashboardInternal], int]:
-        """Obtener todos los dashboards con paginación"""
-        base_query = """
+        # SQL precompilado: los filtros opcionales van como parámetros NULL-ables,
+        # así el texto es idéntico entre llamadas y solo varían los parámetros
+        select_from = """
         SELECT
             d.dash_id as dashboard_id,
             e.empresa_id as empresa_id,
@@ -40,26 +66,9 @@ class DashboardService:
             `marketing-dwh-specs.DWH.DIM_EMPRESA` e
             ON p.empresa_id = e.empresa_id
         """
-
-        where_clause = ""
-        query_params = []
-
-        if product_id or company_id:
-            where_conditions = []
-            if company_id:
-                where_conditions.append("e.empresa_id = @company_id")
-                query_params.append(
-                    bigquery.ScalarQueryParameter("company_id", "STRING", company_id)
-                )
-            if product_id:
-                where_conditions.append("p.producto_id = @product_id")
-                query_params.append(
-                    bigquery.ScalarQueryParameter("product_id", "STRING", product_id)
-                )
-            if where_conditions:
-                where_clause = "WHERE " + " AND ".join(where_conditions)
-
-        count_query = f"""
+        filters = """(@company_id IS NULL OR e.empresa_id = @company_id)
+          AND (@product_id IS NULL OR p.producto_id = @product_id)"""
+        self._dashboards_count_sql = f"""
         SELECT COUNT(*) as total
         FROM
             `marketing-dwh-specs.DWH.DIM_MAESTRO_DASH` d
@@ -69,31 +78,166 @@ class DashboardService:
         LEFT JOIN
             `marketing-dwh-specs.DWH.DIM_EMPRESA` e
             ON p.empresa_id = e.empresa_id
-        {where_clause}
+        WHERE {filters}
         """
-
-        data_query = f"""
-        {base_query}
-        {where_clause}
-        ORDER BY d.fecha_creacion DESC
+        # Sin filtros el total sale de los metadatos de la tabla (cada dashboard
+        # tiene a lo sumo un producto y una empresa, el JOIN no cambia el conteo)
+        self._dashboards_total_sql = """
+        SELECT row_count as total
+        FROM `marketing-dwh-specs.DWH.__TABLES__`
+        WHERE table_id = 'DIM_MAESTRO_DASH'
+        """
+        self._dashboards_page_sql = f"""
+        {select_from}
+        WHERE {filters}
+        ORDER BY d.fecha_creacion DESC NULLS LAST, d.dash_id ASC
         LIMIT @limit
         OFFSET @skip
         """
+        # El keyset solo aplica a la página, no al total. Filas sin fecha_creacion van
+        # al final (NULLS LAST); un cursor con fecha NULL sigue solo entre ellas por dash_id
+        self._dashboards_keyset_sql = f"""
+        {select_from}
+        WHERE {filters}
+          AND ((@after_fecha IS NOT NULL
+                AND (d.fecha_creacion < @after_fecha
+                     OR (d.fecha_creacion = @after_fecha AND d.dash_id > @after_id)
+                     OR d.fecha_creacion IS NULL))
+               OR (@after_fecha IS NULL
+                   AND d.fecha_creacion IS NULL AND d.dash_id > @after_id))
+        ORDER BY d.fecha_creacion DESC NULLS LAST, d.dash_id ASC
+        LIMIT @limit
+        """
+        self._dashboard_by_product_sql = f"""
+        {select_from}
+        WHERE p.producto_id = @product_id
+        LIMIT 1
+        """
+
+    def invalidate_counts(self) -> None:
+        """Descartar totales cacheados (llamar tras cualquier escritura en DIM_MAESTRO_DASH)"""
+        self._count_cache.clear()
+
+    async def _run_query(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> list:
+        """Ejecutar una query de BigQuery fuera del event loop y devolver todas las filas"""
+        async with self._semaphore:
+            return await asyncio.to_thread(
+                lambda: list(self.client.query(sql, job_config=job_config).result())
+            )
+
+    async def _fetch_page(
+        self, sql: str, job_config: bigquery.QueryJobConfig, limit: int
+    ) -> list:
+        """Traer exactamente una página en una sola llamada HTTP"""
+        async with self._semaphore:
+            return await asyncio.to_thread(
+                lambda: list(
+                    self.client.query(sql, job_config=job_config)
+                    .result(page_size=limit, max_results=limit)
+                )
+            )
+
+    async def _run_job(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> bigquery.QueryJob:
+        """Ejecutar una query (o DML) fuera del event loop y devolver el job terminado"""
+        def run():
+            job = self.client.query(sql, job_config=job_config)
+            job.result()
+            return job
+
+        async with self._semaphore:
+            return await asyncio.to_thread(run)
+
+    async def _cached_count(
+        self, key: tuple, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> int:
+        """
+        Total de filas para un filtro, cacheado COUNT_CACHE_TTL segundos.
+
+        Un solo COUNT(*) en vuelo por clave: las requests concurrentes que fallan
+        la cache para el mismo filtro comparten la misma tarea hasta que termina;
+        los misses de otros filtros no esperan.
+        """
+        total = self._count_cache.get(key)
+        if total is not None:
+            return total
+        return await self._count_flight.do(key, lambda: self._load_count(key, sql, job_config))
+
+    async def _load_count(
+        self, key: tuple, sql: str, job_config: Optional[bigquery.QueryJobConfig]
+    ) -> int:
+        """Ejecutar el COUNT(*) de una clave y guardarlo en la cache"""
+        rows = await self._run_query(sql, job_config)
+        total = rows[0].total if rows else 0
+        self._count_cache.set(key, total)
+        return total
+
+    async def get_dashboards(
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        company_id: Optional[str] = None,
+        product_id: Optional[str] = None,
+        after: Optional[tuple[Optional[datetime], str]] = None,
+    ) -> tuple[List[DashboardInternal], int]:
+        """
+        Obtener todos los dashboards con paginación.
+
+        Con `after` (fecha_creacion, dashboard_id de la última fila de la página anterior)
+        se pagina por keyset y se ignora `skip`; sin él se mantiene el OFFSET.
+        """
+        # Filtros vacíos equivalen a sin filtro
+        company_id = company_id or None
+        product_id = product_id or None
+        filter_params = [
+            bigquery.ScalarQueryParameter("company_id", "STRING", company_id),
+            bigquery.ScalarQueryParameter("product_id", "STRING", product_id),
+        ]
+        data_query = (
+            self._dashboards_keyset_sql if after is not None else self._dashboards_page_sql
+        )
 
         try:
-            count_job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            count_job = self.client.query(count_query, job_config=count_job_config)
-            count_result = list(count_job.result())
-            total_count = count_result[0].total if count_result else 0
+            # SQL y parámetros estables: dejar explícito el uso de la cache de resultados
+            count_job_config = bigquery.QueryJobConfig(
+                query_parameters=filter_params,
+                use_query_cache=True,
+                labels={"endpoint": "get_dashboards"},
+            )
 
-            data_params = query_params + [
+            data_params = filter_params + [
                 bigquery.ScalarQueryParameter("limit", "INT64", limit),
-                bigquery.ScalarQueryParameter("skip", "INT64", skip),
             ]
-            data_job_config = bigquery.QueryJobConfig(query_parameters=data_params)
-            data_job = self.client.query(data_query, job_config=data_job_config)
-            results = data_job.result()
-            dashboards = [DashboardInternal(**dict(row)) for row in results]
+            if after is not None:
+                data_params += [
+                    bigquery.ScalarQueryParameter("after_fecha", "DATETIME", after[0]),
+                    bigquery.ScalarQueryParameter("after_id", "STRING", after[1]),
+                ]
+            else:
+                data_params.append(bigquery.ScalarQueryParameter("skip", "INT64", skip))
+            data_job_config = bigquery.QueryJobConfig(
+                query_parameters=data_params,
+                use_query_cache=True,
+                labels={"endpoint": "get_dashboards"},
+            )
+
+            count_sql = (
+                self._dashboards_count_sql
+                if company_id or product_id
+                else self._dashboards_total_sql
+            )
+
+            # Total y página corren en paralelo en BigQuery
+            total_count, results = await asyncio.gather(
+                self._cached_count(
+                    (company_id, product_id), count_sql, count_job_config
+                ),
+                self._fetch_page(data_query, data_job_config, limit),
+            )
+            dashboards = [_dashboard_from_row(row) for row in results]
 
             return dashboards, total_count
         except Exception as e:
@@ -101,39 +245,15 @@ class DashboardService:
 
     async def get_dashboard_by_product_id(self, product_id: str) -> Optional[DashboardInternal]:
         """Obtener un dashboard por producto_id"""
-        query = """
-        SELECT
-            d.dash_id as dashboard_id,
-            e.empresa_id as empresa_id,
-            p.producto_id as producto_id,
-            p.nombre_producto as nombre_dashboard,
-            e.nombre_empresa as nombre_empresa,
-            d.url,
-            d.url_embebido as embed_url,
-            d.Estado as estado,
-            d.fecha_creacion,
-            d.fecha_actualizacion
-        FROM
-            `marketing-dwh-specs.DWH.DIM_MAESTRO_DASH` d
-        LEFT JOIN
-            `marketing-dwh-specs.DWH.DIM_PRODUCTO` p
-            ON d.producto_id = p.producto_id
-        LEFT JOIN
-            `marketing-dwh-specs.DWH.DIM_EMPRESA` e
-            ON p.empresa_id = e.empresa_id
-        WHERE p.producto_id = @product_id
-        LIMIT 1
-        """
         query_params = [
             bigquery.ScalarQueryParameter("product_id", "STRING", product_id)
         ]
         try:
             job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            job = self.client.query(query, job_config=job_config)
-            results = list(job.result())
+            results = await self._run_query(self._dashboard_by_product_sql, job_config)
             if not results:
                 return None
-            return DashboardInternal(**dict(results[0]))
+            return _dashboard_from_row(results[0])
         except Exception as e:
             raise DatabaseConnectionError(details={"Dashboard get by product_id error": str(e)})
 
@@ -157,8 +277,8 @@ class DashboardService:
         ]
         try:
             job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            job = self.client.query(insert_query, job_config=job_config)
-            job.result()
+            job = await self._run_job(insert_query, job_config)
+            self.invalidate_counts()
             return job.num_dml_affected_rows or 0
         except Exception as e:
             raise DatabaseConnectionError(details={"Dashboard create error": str(e)})
@@ -193,8 +313,7 @@ class DashboardService:
 
         try:
             job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            job = self.client.query(update_query, job_config=job_config)
-            job.result()
+            job = await self._run_job(update_query, job_config)
             return job.num_dml_affected_rows or 0
         except Exception as e:
             raise DatabaseConnectionError(details={"Dashboard update error": str(e)})
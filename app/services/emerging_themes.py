@@ -1,15 +1,18 @@
-from typing import Tuple, List, Optional
-from datetime import datetime, timedelta
+from typing import Tuple, Optional
+from datetime import date, datetime, timedelta, timezone
 from google.cloud import bigquery
+import asyncio
 import logging
-import json
+import orjson
 import httpx
 import os
-import pandas as pd
+import pyarrow as pa
 import random
-import string
+import time
 
-from app.core.config import bigquery_config
+from app.core.config import bigquery_config, settings
+from app.utils.cache import TTLCache
+from app.utils.singleflight import SingleFlight
 from app.core.exceptions import DatabaseConnectionError
 from app.integrations.openai.emerging_themes_batch import (
     OpenAIEmergingThemesBatchIntegration,
@@ -22,6 +25,15 @@ logger = logging.getLogger(__name__)
 class EmergingThemesService:
     """Service for analyzing emerging themes from app reviews using AI."""
 
+    # Seconds to wait inline for the small LIMIT 1 lookups (jobs.query short mode)
+    LOOKUP_WAIT_TIMEOUT = 10.0
+    # Server-side limit for those lookups: BigQuery cancels the job instead of letting it run on
+    LOOKUP_JOB_TIMEOUT_MS = 5000
+    # Minimum reviews in the window for an analysis to be worth running
+    MIN_REVIEWS = 20
+    # Seconds a cache-lookup miss is remembered in process
+    ANALYSIS_MISS_TTL = 60
+
     def __init__(self):
         self.client = bigquery_config.get_client()
         self.reviews_table = bigquery_config.get_table_id("DIM_REVIEWS_HISTORICO")
@@ -30,7 +42,147 @@ class EmergingThemesService:
             "AIOutput", "EMERGING_THEMES"
         )
         self.batch_integration = OpenAIEmergingThemesBatchIntegration()
+        # Shared HTTP/2 connection pool for the global analysis' OpenAI calls: concurrent
+        # analyses multiplex over one TLS connection. Closed in the lifespan
+        self._http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=200, max_keepalive_connections=100, keepalive_expiry=30
+            ),
+            timeout=httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=10.0),
+        )
         self.cache_expiration_hours = 24  # Caché válido por 24 horas
+        # Nombre y categoría por app_id: cambian muy poco, se cachean 1 hora
+        self._metadata_cache = TTLCache(maxsize=1024, ttl=3600)
+        # Una tarea por app_id en vuelo: una sola query por app ante requests concurrentes
+        self._metadata_flight = SingleFlight()
+        # Bound in-flight BigQuery queries so bursts queue here, not in the HTTP pool
+        self._semaphore = asyncio.Semaphore(settings.BQ_MAX_CONCURRENT_QUERIES)
+        # The 90-day reviews scans get a much lower ceiling of their own, so a burst
+        # of analyses queues here instead of piling onto BigQuery; the LIMIT 1 lookups
+        # keep using the shared bound and are never stuck behind them
+        self._reviews_semaphore = asyncio.Semaphore(
+            settings.EMERGING_THEMES_MAX_CONCURRENT_SCANS
+        )
+        # Analyses in flight by (kind, app_id, force): concurrent identical requests
+        # await the same task instead of each launching its own BigQuery/OpenAI work
+        self._inflight = SingleFlight()
+        # Analysis cache hits by cache_key, stored with the monotonic time they were read
+        # so the age can be advanced locally until the 24h window runs out
+        self._analysis_cache = TTLCache(
+            maxsize=1024, ttl=self.cache_expiration_hours * 3600
+        )
+        # Recent misses by cache_key, so clients polling for an analysis don't hit
+        # BigQuery on every call; short TTL so new rows show up within a minute
+        self._analysis_misses = TTLCache(maxsize=1024, ttl=self.ANALYSIS_MISS_TTL)
+
+        # Precompiled SQL: identical text across calls, only parameters change
+        self._app_metadata_sql = f"""
+        SELECT 
+            app_name,
+            app_categoria as app_category
+        FROM `{self.maestro_table}`
+        WHERE app_id = @app_id
+        LIMIT 1
+        """
+        self._reviews_sql = f"""
+        SELECT 
+            content,
+            score,
+            fecha
+        FROM `{self.reviews_table}`
+        WHERE app_id = @app_id
+            AND fecha >= @start_date
+            AND fecha <= @end_date
+            AND content IS NOT NULL
+            AND TRIM(content) != ''
+        -- Apps below the minimum return no rows instead of shipping reviews we'd reject
+        QUALIFY COUNT(*) OVER () >= @min_reviews
+        ORDER BY fecha DESC
+        LIMIT 1500
+        """
+        self._cached_analysis_sql = f"""
+        SELECT 
+            batch_id,
+            app_id,
+            total_reviews_analyzed,
+            analysis_period_start,
+            analysis_period_end,
+            created_at,
+            TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), created_at, HOUR) as age_hours
+        FROM `{self.emerging_themes_table}`
+        WHERE cache_key = @cache_key
+            AND created_at >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @expiration_hours HOUR)
+        ORDER BY created_at DESC
+        LIMIT 1
+        """
+        # App name and category come joined from the maestro table in the same query
+        self._latest_analysis_sql = f"""
+        SELECT 
+            t.analysis_id,
+            t.app_id,
+            t.batch_id,
+            t.json_data,
+            t.analysis_period_start,
+            t.analysis_period_end,
+            t.total_reviews_analyzed,
+            t.analyzed_at,
+            t.created_at,
+            m.app_name,
+            m.app_categoria as app_category
+        FROM `{self.emerging_themes_table}` t
+        LEFT JOIN `{self.maestro_table}` m
+            ON t.app_id = m.app_id
+        WHERE t.app_id = @app_id
+        ORDER BY t.created_at DESC
+        LIMIT 1
+        """
+
+    async def _lookup(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> Optional[bigquery.Row]:
+        """
+        Run a LIMIT 1 lookup with query_and_wait in a worker thread and return the
+        first row, or None.
+
+        Uses jobs.query, so short queries return their rows in the first RPC
+        instead of creating a job and polling for it; max_results=1 keeps the
+        client from ever asking for another page. Results cache use is explicit
+        and the job gets a short server-side timeout so anomalies fail fast.
+        """
+        job_config = job_config or bigquery.QueryJobConfig()
+        job_config.use_query_cache = True
+        job_config.job_timeout_ms = self.LOOKUP_JOB_TIMEOUT_MS
+
+        async with self._semaphore:
+            return await asyncio.to_thread(
+                lambda: next(
+                    iter(
+                        self.client.query_and_wait(
+                            sql,
+                            job_config=job_config,
+                            wait_timeout=self.LOOKUP_WAIT_TIMEOUT,
+                            max_results=1,
+                        )
+                    ),
+                    None,
+                )
+            )
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP transport (called on app shutdown)."""
+        await self._http_client.aclose()
+
+    async def _coalesce(self, key: tuple, factory) -> any:
+        """
+        Single-flight: run factory() once per key and let concurrent callers await
+        the same task.
+
+        The task is shielded so a caller that disconnects doesn't cancel the work
+        for the others; the key is released as soon as the task finishes, so later
+        calls go through the normal cache path.
+        """
+        return await self._inflight.do(key, factory)
 
     async def analyze_emerging_themes(
         self, app_id: str, force_new_analysis: bool = False
@@ -53,16 +205,33 @@ class EmergingThemesService:
             DatabaseConnectionError: If BigQuery query fails
             ValueError: If app not found or has no reviews
         """
+        return await self._coalesce(
+            ("batch", app_id, force_new_analysis),
+            lambda: self._analyze_emerging_themes(app_id, force_new_analysis),
+        )
+
+    async def _analyze_emerging_themes(
+        self, app_id: str, force_new_analysis: bool
+    ) -> Tuple[any, dict]:
+        """Body of analyze_emerging_themes, run once per in-flight key."""
         try:
             # Calculate date range (last 90 days)
-            end_date = datetime.utcnow()
+            end_date = datetime.now(timezone.utc)
             start_date = end_date - timedelta(days=90)
+            start_day, end_day = start_date.date(), end_date.date()
             
             # Generate cache key
-            cache_key = self._generate_cache_key(app_id, start_date, end_date)
+            cache_key = self._generate_cache_key(app_id, start_day, end_day)
             
+            # Start the metadata lookup speculatively so it overlaps the cache check;
+            # cancelled if the cache hits
+            metadata_task = asyncio.create_task(self._get_app_metadata(app_id))
+
             # Check for cached analysis (unless forced)
-            if not force_new_analysis:
+            if force_new_analysis:
+                self._analysis_cache.pop(cache_key)
+                self._analysis_misses.pop(cache_key)
+            else:
                 cached_analysis = await self._find_cached_analysis(cache_key)
                 
                 if cached_analysis:
@@ -74,30 +243,27 @@ class EmergingThemesService:
                     
                     # Return cached batch info with updated metadata
                     cached_analysis["from_cache"] = True
+                    metadata_task.cancel()
                     return None, cached_analysis  # None for batch since it's cached
             
-            # Get app metadata (name and category)
-            app_metadata = await self._get_app_metadata(app_id)
-            
+            # Finish the app metadata (name and category) while fetching reviews
+            # from last 90 days: the two BigQuery jobs run in parallel
+            app_metadata, reviews = await asyncio.gather(
+                metadata_task,
+                self._get_reviews_last_90_days(app_id, start_day, end_day),
+            )
+
             if not app_metadata:
                 raise ValueError(f"App with ID '{app_id}' not found")
 
-            # Fetch reviews from last 90 days
-            reviews = await self._get_reviews_last_90_days(app_id, start_date, end_date)
-
-            if not reviews:
-                raise ValueError(
-                    f"No reviews found for app '{app_id}' in the last 90 days"
-                )
-            
-            if len(reviews) < 20:
+            if reviews.num_rows == 0:
                 raise ValueError(
-                    f"Not enough reviews ({len(reviews)}) for app '{app_id}' to perform analysis. Minimum 20 required."
+                    f"Not enough reviews for app '{app_id}' in the last 90 days to perform analysis. Minimum {self.MIN_REVIEWS} required."
                 )
 
             logger.info(
-                f"Found {len(reviews)} reviews for app {app_id} "
-                f"from {start_date.date()} to {end_date.date()}"
+                f"Found {reviews.num_rows} reviews for app {app_id} "
+                f"from {start_day} to {end_day}"
             )
 
             # Send to OpenAI Batch API
@@ -108,6 +274,7 @@ class EmergingThemesService:
                 reviews=reviews,
                 start_date=start_date,
                 end_date=end_date,
+                cache_key=cache_key,
             )
 
             # Prepare metadata for response
@@ -115,7 +282,7 @@ class EmergingThemesService:
                 "app_id": app_id,
                 "app_name": app_metadata["app_name"],
                 "app_category": app_metadata["app_category"],
-                "total_reviews": len(reviews),
+                "total_reviews": reviews.num_rows,
                 "start_date": start_date,
                 "end_date": end_date,
                 "batch_id": batch.id,
@@ -144,16 +311,33 @@ class EmergingThemesService:
         """
         Analiza temas emergentes de manera global usando un solo prompt y request síncrona a OpenAI.
         """
+        return await self._coalesce(
+            ("global", app_id, force_new_analysis),
+            lambda: self._analyze_emerging_themes_global(app_id, force_new_analysis),
+        )
+
+    async def _analyze_emerging_themes_global(
+        self, app_id: str, force_new_analysis: bool
+    ) -> dict:
+        """Cuerpo de analyze_emerging_themes_global, una ejecución por clave en vuelo."""
         try:
             # Calcular rango de fechas (últimos 90 días)
-            end_date = datetime.utcnow()
+            end_date = datetime.now(timezone.utc)
             start_date = end_date - timedelta(days=90)
+            start_day, end_day = start_date.date(), end_date.date()
 
             # Generate cache key
-            cache_key = self._generate_cache_key(app_id, start_date, end_date)
+            cache_key = self._generate_cache_key(app_id, start_day, end_day)
+
+            # Start the metadata lookup speculatively so it overlaps the cache check;
+            # cancelled if the cache hits
+            metadata_task = asyncio.create_task(self._get_app_metadata(app_id))
 
             # Check for cached analysis (unless forced)
-            if not force_new_analysis:
+            if force_new_analysis:
+                self._analysis_cache.pop(cache_key)
+                self._analysis_misses.pop(cache_key)
+            else:
                 cached_analysis = await self._find_cached_analysis(cache_key)
                 
                 if cached_analysis:
@@ -164,26 +348,26 @@ class EmergingThemesService:
                     
                     # Return cached batch info with updated metadata
                     cached_analysis["from_cache"] = True
+                    metadata_task.cancel()
 
                     return cached_analysis  # None for batch since it's cached
 
-            # Get app metadata (name and category)
-            app_metadata = await self._get_app_metadata(app_id)
+            # Finish the app metadata (name and category) while fetching reviews
+            # from last 90 days: the two BigQuery jobs run in parallel
+            app_metadata, reviews = await asyncio.gather(
+                metadata_task,
+                self._get_reviews_last_90_days(app_id, start_day, end_day),
+            )
 
             if not app_metadata:
                 raise ValueError(f"App with ID '{app_id}' not found")
 
-            # Fetch reviews from last 90 days
-            reviews = await self._get_reviews_last_90_days(app_id, start_date, end_date)
-
-            if not reviews:
-                raise ValueError(f"No reviews found for app '{app_id}' in the last 90 days")
-            if len(reviews) < 20:
-                raise ValueError( f"Not enough reviews ({len(reviews)}) for app '{app_id}' to perform analysis. Minimum 20 required.")
+            if reviews.num_rows == 0:
+                raise ValueError(f"Not enough reviews for app '{app_id}' in the last 90 days to perform analysis. Minimum {self.MIN_REVIEWS} required.")
 
             logger.info(
-                f"Found {len(reviews)} reviews for app {app_id} "
-                f"from {start_date.date()} to {end_date.date()}"
+                f"Found {reviews.num_rows} reviews for app {app_id} "
+                f"from {start_day} to {end_day}"
             )
 
             # Build global prompt
@@ -191,21 +375,12 @@ class EmergingThemesService:
                 app_id=app_id,
                 app_name=app_metadata["app_name"],
                 app_category=app_metadata["app_category"],
-                total_reviews=len(reviews),
+                total_reviews=reviews.num_rows,
                 start_date=start_date.strftime("%Y-%m-%d"),
                 end_date=end_date.strftime("%Y-%m-%d"),
             )
-            # Build user content
-            formatted_reviews = []
-
-            for idx, (content, score, review_date) in enumerate(reviews, 1):
-                date_str = review_date.strftime("%Y-%m-%d")
-                formatted_review = f"Review {idx} | {date_str} | Score: {score}/5\n{content}\n"
-                formatted_reviews.append(formatted_review)
-
-            # Join all reviews with separator
-            all_reviews = "\n" + "="*80 + "\n\n".join(formatted_reviews)
-            user_content = f"""A continuación se presentan {len(reviews)} reviews de usuarios para analizar: \n\n{all_reviews}\n\nAnaliza estas reviews e identifica los temas emergentes según las instrucciones proporcionadas en el prompt del sistema."""
+            # Same review formatting as the batch requests
+            user_content = self.batch_integration._build_user_content(reviews)
 
             # Prepare request to OpenAI
             api_key = os.getenv("OPENAI_API_KEY")
@@ -227,10 +402,9 @@ class EmergingThemesService:
             }
 
             # OpenAI request
-            async with httpx.AsyncClient(timeout=120) as client:
-                resp = await client.post(url, headers=headers, json=body)
-                resp.raise_for_status()
-                data = resp.json()
+            resp = await self._http_client.post(url, headers=headers, json=body)
+            resp.raise_for_status()
+            data = orjson.loads(resp.content)
 
             # Extract emerging themes from response
             if (
@@ -243,46 +417,54 @@ class EmergingThemesService:
             ):
                 content = data["choices"][0]["message"]["content"]
                 try:
-                    themes_json = json.loads(content)
+                    themes_json = orjson.loads(content)
                 except Exception:
                     themes_json = {"themes": []}
             else:
                 themes_json = {"themes": []}
 
             # Save in BigQuery (EMERGING_THEMES)
-            analyzed_at = datetime.utcnow()
+            analyzed_at = datetime.now(timezone.utc)
             created_at = analyzed_at
 
             def generar_codigo():
-                numbers = "".join(random.choices(string.digits, k=6))
-                return f"et{numbers}"
+                return f"et{random.randrange(1_000_000):06d}"
             
             analysis_id = generar_codigo()
-            cache_key = f"{app_id}_{start_date.date()}_{end_date.date()}"
-            df = pd.DataFrame([{
+            # EMERGING_THEMES row for insert_rows_json: DATE/TIMESTAMP values go as ISO
+            # strings and json_data as a JSON string. analysis_id, app_id, cache_key STRING;
+            # batch_id STRING (NULL here); analysis_period_start/end DATE;
+            # total_reviews_analyzed INT64; analyzed_at/created_at TIMESTAMP.
+            # Keep this a plain dict: a pandas load job costs a Parquet round trip per row
+            row = {
                 "analysis_id": analysis_id,
                 "app_id": app_id,
                 "batch_id": None,
-                "json_data": json.dumps(themes_json, ensure_ascii=False),
-                "analysis_period_start": start_date.date(),
-                "analysis_period_end": end_date.date(),
-                "total_reviews_analyzed": len(reviews),
-                "analyzed_at": analyzed_at,
-                "created_at": created_at,
+                "json_data": orjson.dumps(themes_json).decode(),
+                "analysis_period_start": start_day.isoformat(),
+                "analysis_period_end": end_day.isoformat(),
+                "total_reviews_analyzed": reviews.num_rows,
+                "analyzed_at": analyzed_at.isoformat(),
+                "created_at": created_at.isoformat(),
                 "cache_key": cache_key
-            }])
-            bq_client = self.client
-            table_id = self.emerging_themes_table
-            job_config = bigquery.LoadJobConfig(write_disposition="WRITE_APPEND")
-            job = bq_client.load_table_from_dataframe(df, table_id, job_config=job_config)
-            job.result()
+            }
+            # One row: a single streaming insert call instead of a Parquet load job
+            errors = await asyncio.to_thread(
+                self.client.insert_rows_json, self.emerging_themes_table, [row]
+            )
+            if errors:
+                raise DatabaseConnectionError(
+                    f"Failed to save emerging themes analysis: {errors}"
+                )
+            # The key has a row now: don't let a recent miss hide it
+            self._analysis_misses.pop(cache_key)
 
             # Build response dict
             result = {
                 "app_id": app_id,
                 "app_name": app_metadata["app_name"],
                 "app_category": app_metadata["app_category"],
-                "total_reviews_analyzed": len(reviews),
+                "total_reviews_analyzed": reviews.num_rows,
                 "analysis_period_start": start_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
                 "analysis_period_end": end_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
                 "themes": f"Go to /emerging-themes/{app_id}/latest to fetch the themes",
@@ -308,15 +490,18 @@ class EmergingThemesService:
         Returns:
             Dict with app_name and app_category, or None if not found
         """
-        query = f"""
-        SELECT 
-            app_name,
-            app_categoria as app_category
-        FROM `{self.maestro_table}`
-        WHERE app_id = @app_id
-        LIMIT 1
-        """
+        cached = self._metadata_cache.get(app_id)
+        if cached is not None:
+            return dict(cached)
+
+        metadata = await self._metadata_flight.do(
+            app_id, lambda: self._load_app_metadata(app_id)
+        )
+        # Every waiter gets the same dict back from the shared task
+        return dict(metadata) if metadata is not None else None
 
+    async def _load_app_metadata(self, app_id: str) -> Optional[dict]:
+        """Query app metadata (one in-flight call per app) and cache it."""
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
                 bigquery.ScalarQueryParameter("app_id", "STRING", app_id)
@@ -324,68 +509,55 @@ class EmergingThemesService:
         )
 
         try:
-            query_job = self.client.query(query, job_config=job_config)
-            results = list(query_job.result())
+            row = await self._lookup(self._app_metadata_sql, job_config)
 
-            if not results:
+            if row is None:
                 return None
 
-            row = results[0]
-            return {
+            metadata = {
                 "app_name": row.app_name or "Unknown App",
                 "app_category": row.app_category or "Unknown Category",
             }
+            self._metadata_cache.set(app_id, metadata)
+            return dict(metadata)
 
         except Exception as e:
             logger.error(f"Error fetching app metadata: {str(e)}")
             raise DatabaseConnectionError(f"Failed to fetch app metadata: {str(e)}")
 
     async def _get_reviews_last_90_days(
-        self, app_id: str, start_date: datetime, end_date: datetime
-    ) -> List[Tuple[str, int, datetime]]:
+        self, app_id: str, start_day: date, end_day: date
+    ) -> pa.Table:
         """
         Fetch reviews for an app from the last 90 days.
 
         Args:
             app_id: Application ID
-            start_date: Start date for filtering
-            end_date: End date for filtering
+            start_day: First day of the window (inclusive)
+            end_day: Last day of the window (inclusive)
 
         Returns:
-            List of tuples: (content, score, fecha)
+            Arrow table with columns content, score and fecha; empty when the app
+            has fewer than MIN_REVIEWS reviews in the window
         """
-        query = f"""
-        SELECT 
-            content,
-            score,
-            fecha
-        FROM `{self.reviews_table}`
-        WHERE app_id = @app_id
-            AND fecha >= @start_date
-            AND fecha <= @end_date
-            AND content IS NOT NULL
-            AND TRIM(content) != ''
-        ORDER BY fecha DESC
-        LIMIT 1500
-        """
-
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
                 bigquery.ScalarQueryParameter("app_id", "STRING", app_id),
-                bigquery.ScalarQueryParameter("start_date", "DATE", start_date.date()),
-                bigquery.ScalarQueryParameter("end_date", "DATE", end_date.date()),
+                bigquery.ScalarQueryParameter("start_date", "DATE", start_day),
+                bigquery.ScalarQueryParameter("end_date", "DATE", end_day),
+                bigquery.ScalarQueryParameter("min_reviews", "INT64", self.MIN_REVIEWS),
             ]
         )
 
         try:
-            query_job = self.client.query(query, job_config=job_config)
-            results = query_job.result()
-
-            reviews = []
-            for row in results:
-                reviews.append((row.content, row.score, row.fecha))
-
-            return reviews
+            # Download through the Storage Read API (Arrow over gRPC) off the event loop
+            bqstorage_client = bigquery_config.get_bqstorage_client()
+            async with self._reviews_semaphore:
+                return await asyncio.to_thread(
+                    lambda: self.client.query(self._reviews_sql, job_config=job_config)
+                    .result()
+                    .to_arrow(bqstorage_client=bqstorage_client)
+                )
 
         except Exception as e:
             logger.error(f"Error fetching reviews: {str(e)}")
@@ -401,23 +573,6 @@ class EmergingThemesService:
         Returns:
             Dict with analysis results including themes, or None if not found
         """
-        query = f"""
-        SELECT 
-            analysis_id,
-            app_id,
-            batch_id,
-            json_data,
-            analysis_period_start,
-            analysis_period_end,
-            total_reviews_analyzed,
-            analyzed_at,
-            created_at
-        FROM `{self.emerging_themes_table}`
-        WHERE app_id = @app_id
-        ORDER BY created_at DESC
-        LIMIT 1
-        """
-
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
                 bigquery.ScalarQueryParameter("app_id", "STRING", app_id)
@@ -425,19 +580,16 @@ class EmergingThemesService:
         )
 
         try:
-            query_job = self.client.query(query, job_config=job_config)
-            results = list(query_job.result())
+            row = await self._lookup(self._latest_analysis_sql, job_config)
 
-            if not results:
+            if row is None:
                 return None
-
-            row = results[0]
             
             # Parse themes from JSON string
             themes = []
             if row.json_data:
                 try:
-                    parsed_data = json.loads(row.json_data)
+                    parsed_data = orjson.loads(row.json_data)
                     # Handle case where data might be wrapped in {"themes": [...]}
                     if isinstance(parsed_data, dict) and "themes" in parsed_data:
                         themes = parsed_data["themes"]
@@ -446,18 +598,15 @@ class EmergingThemesService:
                     else:
                         logger.warning(f"Unexpected JSON structure: {type(parsed_data)}")
                         themes = []
-                except json.JSONDecodeError as e:
+                except orjson.JSONDecodeError as e:
                     logger.error(f"Failed to parse themes JSON: {e}")
                     themes = []
 
-            # Get app metadata (name and category) from maestro table
-            app_metadata = await self._get_app_metadata(app_id)
-            
             return {
                 "app_id": row.app_id,
                 "batch_id": row.batch_id,
-                "app_name": app_metadata["app_name"] if app_metadata else "Unknown App",
-                "app_category": app_metadata["app_category"] if app_metadata else "Unknown Category",
+                "app_name": row.app_name or "Unknown App",
+                "app_category": row.app_category or "Unknown Category",
                 "total_reviews_analyzed": row.total_reviews_analyzed,
                 "analysis_period_start": row.analysis_period_start,
                 "analysis_period_end": row.analysis_period_end,
@@ -470,20 +619,25 @@ class EmergingThemesService:
             raise DatabaseConnectionError(f"Failed to retrieve analysis: {str(e)}")
 
     def _generate_cache_key(
-        self, app_id: str, start_date: datetime, end_date: datetime
+        self, app_id: str, start_day: date, end_day: date
     ) -> str:
         """
         Generate a unique cache key for an analysis period.
 
+        Contract with the batch result writer (download-emerging-themes-batch, outside
+        this repo): it stores the cache_key sent in the batch metadata as is. Writers
+        that predate that field rebuild it as app_id_YYYY-MM-DD_YYYY-MM-DD, so the
+        format must not change until every writer reads it from the metadata.
+
         Args:
             app_id: Application ID
-            start_date: Start date of analysis
-            end_date: End date of analysis
+            start_day: First day of the analysis window
+            end_day: Last day of the analysis window
 
         Returns:
             Cache key string (format: app_id_YYYY-MM-DD_YYYY-MM-DD)
         """
-        return f"{app_id}_{start_date.date()}_{end_date.date()}"
+        return f"{app_id}_{start_day}_{end_day}"
 
     async def _find_cached_analysis(self, cache_key: str) -> dict:
         """
@@ -495,21 +649,15 @@ class EmergingThemesService:
         Returns:
             Dict with cached analysis metadata, or None if not found/expired
         """
-        query = f"""
-        SELECT 
-            batch_id,
-            app_id,
-            total_reviews_analyzed,
-            analysis_period_start,
-            analysis_period_end,
-            created_at,
-            TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), created_at, HOUR) as age_hours
-        FROM `{self.emerging_themes_table}`
-        WHERE cache_key = @cache_key
-            AND TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), created_at, HOUR) <= @expiration_hours
-        ORDER BY created_at DESC
-        LIMIT 1
-        """
+        entry = self._analysis_cache.get(cache_key)
+        if entry is not None:
+            fetched_at, analysis = entry
+            age_hours = analysis["cache_age_hours"] + (time.monotonic() - fetched_at) / 3600
+            if age_hours <= self.cache_expiration_hours:
+                return {**analysis, "cache_age_hours": age_hours}
+            self._analysis_cache.pop(cache_key)
+        if self._analysis_misses.get(cache_key):
+            return None
 
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
@@ -521,16 +669,15 @@ class EmergingThemesService:
         )
 
         try:
-            query_job = self.client.query(query, job_config=job_config)
-            results = list(query_job.result())
+            row = await self._lookup(self._cached_analysis_sql, job_config)
             logger.debug(f"Cache key used: {cache_key}")
-            logger.debug(f"Cache query results: {results}")
+            logger.debug(f"Cache query result: {row}")
 
-            if not results:
+            if row is None:
+                self._analysis_misses.set(cache_key, True)
                 return None
 
-            row = results[0]
-            return {
+            analysis = {
                 "batch_id": row.batch_id,
                 "app_id": row.app_id,
                 "total_reviews": row.total_reviews_analyzed,
@@ -539,6 +686,8 @@ class EmergingThemesService:
                 "created_at": row.created_at,
                 "cache_age_hours": float(row.age_hours) if row.age_hours else 0.0,
             }
+            self._analysis_cache.set(cache_key, (time.monotonic(), analysis))
+            return dict(analysis)
 
         except Exception as e:
             logger.warning(f"Error checking cache (continuing with new analysis): {str(e)}")
@@ -1,5 +1,6 @@
 from typing import Optional, List
-import json
+import asyncio
+import orjson
 import logging
 import hashlib
 from datetime import datetime, timezone
@@ -11,6 +12,19 @@ from app.schemas.insights import InsightItem, PaginatedAppInsightsResponse
 
 logger = logging.getLogger(__name__)
 
+# Insight types reported as negative (actionable); anything else is positive
+_NEGATIVE_TYPES = frozenset({
+    "feature_gap", "adoption_barrier", "satisfaction_driver",
+    "technical_issue", "usability_issue",
+})
+
+# Simulated change values by recommendation priority
+_PRIORITY_CHANGE_OPTIONS = {
+    "high": ["+45%", "+50%", "+40%", "+55%"],
+    "medium": ["+25%", "+30%", "+20%", "+35%"],
+    "low": ["+10%", "+15%", "+12%", "+18%"],
+}
+
 
 class InsightsService:
     """Service for retrieving and processing app insights from AI analysis data"""
@@ -76,7 +90,7 @@ class InsightsService:
             query = f"""
             SELECT 
                 json_data,
-                review_date,
+                FORMAT_DATE('%Y-%m', review_date) AS period,
                 analyzed_at
             FROM `{self.analysis_table_id}`
             {where_clause}
@@ -85,8 +99,13 @@ class InsightsService:
 
             job_config = bigquery.QueryJobConfig(query_parameters=query_params)
             
-            query_job = self.client.query(query, job_config=job_config)
-            results = list(query_job.result())
+            # jobs.query fast path: short queries return their rows in the first RPC.
+            # Runs in a worker thread so the event loop keeps serving other requests
+            results = await asyncio.to_thread(
+                lambda: list(
+                    self.client.query_and_wait(query, job_config=job_config, wait_timeout=30)
+                )
+            )
 
             if not results:
                 logger.info(f"No analysis data found for app: {app_id}")
@@ -147,12 +166,7 @@ class InsightsService:
         
         # Method 1: Use priority if available (for recommendations)
         if priority:
-            priority_mapping = {
-                "high": ["+45%", "+50%", "+40%", "+55%"],
-                "medium": ["+25%", "+30%", "+20%", "+35%"], 
-                "low": ["+10%", "+15%", "+12%", "+18%"]
-            }
-            options = priority_mapping.get(priority.lower(), ["+20%"])
+            options = _PRIORITY_CHANGE_OPTIONS.get(priority.lower(), ["+20%"])
             
         # Method 2: Use sentiment score if available
         elif sentiment_score is not None:
@@ -210,15 +224,14 @@ class InsightsService:
         
         for row in results:
             try:
-                analysis_data = json.loads(row.json_data)
-                review_date = row.review_date
+                analysis_data = orjson.loads(row.json_data)
                 analyzed_at = row.analyzed_at
-                period = review_date.strftime("%Y-%m") if review_date else "unknown"
+                # Period (YYYY-MM) comes formatted from BigQuery
+                period = row.period or "unknown"
                 
                 # Store analysis metadata for temporal processing
                 analysis_meta = {
                     'data': analysis_data,
-                    'review_date': review_date,
                     'analyzed_at': analyzed_at,
                     'period': period,
                     'recency_score': self._calculate_recency_score(analyzed_at)
@@ -233,7 +246,7 @@ class InsightsService:
                 raw_insights = self._extract_insights_with_metadata(analysis_meta)
                 all_raw_insights.extend(raw_insights)
                 
-            except (json.JSONDecodeError, KeyError, AttributeError) as e:
+            except (orjson.JSONDecodeError, KeyError, AttributeError) as e:
                 logger.warning(f"Error processing analysis data: {e}")
                 continue
         
@@ -523,10 +536,9 @@ class InsightsService:
         for row in results:
             try:
                 # Parse the JSON data
-                analysis_data = json.loads(row.json_data)
-                review_date = row.review_date
-                # Extract period from review_date (YYYY-MM format)
-                period =  review_date.strftime("%Y-%m") if review_date else "unknown"
+                analysis_data = orjson.loads(row.json_data)
+                # Period (YYYY-MM) comes formatted from BigQuery
+                period = row.period or "unknown"
                 # Process strengths as positive insights
                 strengths = analysis_data.get("strengths", [])
                 for strength in strengths:
@@ -578,7 +590,7 @@ class InsightsService:
                         period=period
                     ))
 
-            except (json.JSONDecodeError, KeyError, AttributeError) as e:
+            except (orjson.JSONDecodeError, KeyError, AttributeError) as e:
                 logger.warning(f"Error processing analysis data: {e}")
                 continue
 
@@ -587,38 +599,23 @@ class InsightsService:
 
     def _determine_insight_type(self, insight_type: str) -> str:
         """Determine if an insight should be categorized as positive or negative."""
-        negative_types = [
-            "feature_gap", "adoption_barrier", "satisfaction_driver", 
-            "technical_issue", "usability_issue"
-        ]
-        
-        if insight_type.lower() in negative_types:
-            return "negative"
-        else:
-            return "positive"
+        return "negative" if insight_type.lower() in _NEGATIVE_TYPES else "positive"
 
 
 
     def _deduplicate_and_sort_insights(self, insights: List[InsightItem]) -> List[InsightItem]:
         """Remove duplicate insights and sort by relevance."""
-        # Simple deduplication based on title similarity
-        seen_titles = set()
-        unique_insights = []
-        
+        # Simple deduplication based on normalized title; the dict keeps the first
+        # occurrence of each title in insertion order
+        seen = {}
         for insight in insights:
-            # Create a normalized title for comparison
-            normalized_title = insight.title.lower().strip()
-            
-            if normalized_title not in seen_titles:
-                seen_titles.add(normalized_title)
-                unique_insights.append(insight)
+            seen.setdefault(insight.title.lower().strip(), insight)
 
-        # Sort: negative insights first (more actionable), then by period descending
+        # Sort negative insights first (more actionable), then by period descending;
+        # the key runs once per insight
+        unique_insights = list(seen.values())
         unique_insights.sort(
-            key=lambda x: (
-                0 if x.type == "negative" else 1,  # Negative first
-                x.period  # Then by period
-            ),
+            key=lambda x: (1 if x.type == "negative" else 0, x.period),
             reverse=True
         )
 
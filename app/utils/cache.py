@@ -0,0 +1,71 @@
+"""
+Small in-process TTL cache.
+
+Used by services to memoize BigQuery results that change slowly (counts,
+metadata lookups). Entries live in a single process; for shared state across
+instances, move to Redis like the session store.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """
+    Bounded mapping whose entries expire after a fixed number of seconds.
+
+    When full, the least recently written entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 60.0):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries kept (default: 128)
+            ttl: Entry lifetime in seconds (default: 60)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store value under key, evicting the oldest entry if full."""
+        self._data.pop(key, None)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove key and return its value (expired or not)."""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def keys(self) -> list:
+        """Snapshot of current keys (may include entries that just expired)."""
+        return list(self._data)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
@@ -0,0 +1,34 @@
+"""
+Opaque keyset-pagination cursors.
+
+A cursor encodes the sort key of the last row of a page, (fecha_creacion, id),
+so the next page can be fetched with a WHERE on the key instead of an OFFSET.
+fecha_creacion may be NULL (those rows sort last); it is encoded as an empty
+date and decoded back to None.
+"""
+
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+def encode_cursor(fecha_creacion: Optional[datetime], row_id: str) -> str:
+    """Encode the sort key of a row as a URL-safe cursor string."""
+    fecha = fecha_creacion.isoformat() if fecha_creacion is not None else ""
+    raw = f"{fecha}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        fecha, row_id = raw.split("|", 1)
+        return (datetime.fromisoformat(fecha) if fecha else None), row_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,49 @@
+"""
+Per-key request coalescing for async services.
+
+Concurrent callers asking for the same key share one in-flight task instead of
+each running the same BigQuery query. Like TTLCache, the state lives in a single
+process.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Run at most one task per key; concurrent callers await the same result.
+
+    The task is dropped from the registry only after it completes, so a caller
+    arriving while it runs always joins it instead of starting a second one.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await factory() for key, sharing the task with any concurrent caller.
+
+        The task is shielded, so one caller being cancelled does not cancel the
+        work the others are waiting on. Exceptions propagate to every caller.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
@@ -1,14 +1,19 @@
-﻿import logging
+﻿import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
-from app.core.config import settings
+from app.core.config import settings, bigquery_config
 from app.core.error_handlers import register_exception_handlers
 from app.middleware.timing import TimingMiddleware
 from app.middleware.logging import LoggingMiddleware
 from app.api.v1.router import api_router
+from app.services.apps import app_service
+from app.services.chat_service import chat_service
+from app.services.emerging_themes import emerging_themes_service
 
 # Configure logging
 logging.basicConfig(
@@ -26,10 +31,27 @@ async def lifespan(app: FastAPI):
     logger.info(f"Environment: {settings.ENVIRONMENT}")
     logger.info(f"Debug mode: {settings.DEBUG}")
 
+    # Bound the default executor used by asyncio.to_thread for blocking BigQuery calls
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(
+            max_workers=settings.BQ_THREAD_POOL_SIZE, thread_name_prefix="bigquery"
+        )
+    )
+
+    # Pay BigQuery auth and connection setup at boot instead of on the first request
+    try:
+        await asyncio.to_thread(bigquery_config.warmup)
+        logger.info("BigQuery client warmed up")
+    except Exception as e:
+        logger.warning(f"BigQuery warmup failed: {e}")
+
     yield
 
     # Shutdown
     logger.info("Shutting down Boomit API...")
+    await app_service.aclose()
+    await chat_service.aclose()
+    await emerging_themes_service.aclose()
 
 
 # Create FastAPI application
@@ -0,0 +1,96 @@
+import pytest
+
+from app.utils import cache as cache_module
+from app.utils.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache_module.time, "monotonic", fake)
+    return fake
+
+
+def test_get_returns_value_before_expiry(clock):
+    cache = TTLCache(ttl=30)
+    cache.set("k", 1)
+    clock.now += 29.9
+
+    assert cache.get("k") == 1
+    assert "k" in cache
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = TTLCache(ttl=30)
+    cache.set("k", 1)
+    clock.now += 30
+
+    assert cache.get("k", "default") == "default"
+    assert "k" not in cache
+    assert len(cache) == 0
+
+
+def test_set_refreshes_expiry(clock):
+    cache = TTLCache(ttl=30)
+    cache.set("k", 1)
+    clock.now += 20
+    cache.set("k", 2)
+    clock.now += 20
+
+    assert cache.get("k") == 2
+
+
+def test_falsy_values_are_cached(clock):
+    cache = TTLCache()
+    cache.set("zero", 0)
+
+    assert cache.get("zero", "default") == 0
+    assert "zero" in cache
+
+
+def test_oldest_write_evicted_when_full(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+
+    assert cache.keys() == ["b", "c"]
+    assert cache.get("a") is None
+
+
+def test_rewrite_moves_key_to_newest(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 10)
+    cache.set("c", 3)
+
+    assert cache.keys() == ["a", "c"]
+    assert cache.get("a") == 10
+
+
+def test_pop_returns_value_even_if_expired(clock):
+    cache = TTLCache(ttl=30)
+    cache.set("k", 1)
+    clock.now += 60
+
+    assert cache.pop("k") == 1
+    assert cache.pop("k", "default") == "default"
+
+
+def test_clear_drops_everything(clock):
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.keys() == []
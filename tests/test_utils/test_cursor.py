@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.utils.cursor import decode_cursor, encode_cursor
+
+
+def test_round_trip_naive_datetime():
+    fecha = datetime(2024, 5, 17, 10, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(fecha, "emp_01")) == (fecha, "emp_01")
+
+
+def test_round_trip_aware_datetime():
+    fecha = datetime(2024, 5, 17, 10, 30, tzinfo=timezone.utc)
+    decoded_fecha, row_id = decode_cursor(encode_cursor(fecha, "emp_01"))
+    assert decoded_fecha == fecha
+    assert decoded_fecha.tzinfo is not None
+    assert row_id == "emp_01"
+
+
+def test_row_id_may_contain_separator():
+    fecha = datetime(2024, 1, 1)
+    assert decode_cursor(encode_cursor(fecha, "a|b|c")) == (fecha, "a|b|c")
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2024, 1, 1), "id/with+chars?")
+    assert all(c.isalnum() or c in "-_=" for c in cursor)
+
+
+def test_null_fecha_round_trips_as_none():
+    cursor = encode_cursor(None, "emp_99")
+    assert decode_cursor(cursor) == (None, "emp_99")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64 at all!!",
+        "bm8tc2VwYXJhdG9y",  # base64 of "no-separator"
+        "bm90LWEtZGF0ZXxpZA==",  # base64 of "not-a-date|id"
+        "",
+    ],
+)
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from app.utils.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", load) for _ in range(10)))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+
+    assert results == [42] * 10
+    assert calls == 1
+    assert len(flight) == 0
+
+
+def test_late_caller_joins_running_task():
+    calls = 0
+    release = None
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "done"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("k", load))
+        await asyncio.sleep(0)
+        assert "k" in flight
+        # Arrives after the first caller started but before it finished
+        second = asyncio.ensure_future(flight.do("k", load))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(main()) == ["done", "done"]
+    assert calls == 1
+
+
+def test_key_released_after_completion():
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    async def main():
+        flight = SingleFlight()
+        first = await flight.do("k", load)
+        second = await flight.do("k", load)
+        return first, second
+
+    assert asyncio.run(main()) == (1, 2)
+
+
+def test_different_keys_run_independently():
+    async def load(value):
+        await asyncio.sleep(0)
+        return value
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(
+            flight.do("a", lambda: load("a")),
+            flight.do("b", lambda: load("b")),
+        )
+
+    assert asyncio.run(main()) == ["a", "b"]
+
+
+def test_exception_reaches_every_caller_and_releases_key():
+    async def fail():
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(
+            flight.do("k", fail), flight.do("k", fail), return_exceptions=True
+        )
+        return flight, results
+
+    flight, results = asyncio.run(main())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(flight) == 0
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    async def load():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def main():
+        flight = SingleFlight()
+        leaving = asyncio.ensure_future(flight.do("k", load))
+        staying = asyncio.ensure_future(flight.do("k", load))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        return await staying
+
+    assert asyncio.run(main()) == "ok"